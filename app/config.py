@@ -1,42 +1,234 @@
-
-
 # Standard library imports and dotenv for environment management
 import os
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping
 from dotenv import load_dotenv
 
-# Initialize environment variables from a .env file using the dotenv package.
-# This practice helps to keep configuration separate from the codebase.
-load_dotenv()
+from app.services.qr_formats import resolve_color
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Service configuration, read from the environment once at import time (see `load_settings`).
+    """
+    # The storage location for QR code images, falling back to a default if not set.
+    qr_storage_path: Path
+
+    # QR code's primary color setting, defaulting to 'crimson' if not set.
+    qr_code_color: str
+
+    # Background color for QR code, with a fallback default color of 'offwhite'.
+    qr_background_hue: str
+
+    # The root URL for the service, utilized for crafting response URLs.
+    # It defaults to the local server address on port 80.
+    service_root_url: str
+
+    # URL path segment under which stored QR code images are downloaded, e.g. http://host/downloads/<name>.
+    # The same path is routed to the API's download endpoint and proxied by nginx.
+    file_serve_directory: str
+
+    # When set (e.g. '/protected-qr-codes/'), downloads are answered with an X-Accel-Redirect to this
+    # internal nginx location: the API only authorizes the request and nginx sends the file.
+    qr_download_accel_prefix: str
+
+    # The secret key for secure operations, like JWT token signing, should remain confidential.
+    secret_key: str
+
+    # Preferred method for encoding and decoding JWT tokens.
+    algorithm: str
+
+    # Lifespan of an access token, expressed in minutes, with a default of 30 minutes.
+    token_lifetime_minutes: int
+
+    # Sample administrator credentials for the demonstration.
+    # In a live system, replace with a secure authentication system.
+    admin_user: str
+    admin_password: str
+
+    # Number of web server worker processes (gunicorn -w), each with its own render pool and admission limits.
+    # Set it for multi-worker deployments (gunicorn reads it too) so the defaults below divide the machine between them.
+    web_concurrency: int
+
+    # Number of worker processes used to render QR codes off the event loop, per web worker.
+    # Defaults to the machine's CPU count divided by WEB_CONCURRENCY; setting it to 0 renders on a background thread instead.
+    render_workers: int
+
+    # Maximum number of render jobs allowed to wait for a free worker.
+    # Callers beyond this depth wait before their job is even queued, bounding memory under load.
+    render_queue_depth: int
+
+    # Renders admitted at once per worker process; 0 means one per render worker.
+    # Requests past this limit wait in the admission queue, which serves token subjects in turn.
+    admission_max_concurrent: int
+
+    # Maximum number of renders waiting for admission; further requests get 503 with Retry-After.
+    admission_max_queue: int
+
+    # Longest a render may wait for admission. Requests whose estimated wait (from the queued cost
+    # and the measured render speed) exceeds it are refused at once instead of timing out later.
+    admission_queue_deadline_seconds: float
+
+    # Largest share (0.0-1.0) of the admission queue one token subject may occupy; 0 disables the limit.
+    admission_client_share: float
+
+    # Memory budget, in megabytes, for the in-process cache of rendered PNG images.
+    image_cache_mb: float
+
+    # SQLite index holding metadata for every stored QR code, kept next to the storage directory.
+    qr_index_path: Path
+
+    # Write PNGs directly from the QR module matrix with NumPy instead of row by row through PyPNG; both write the same image.
+    qr_fast_raster: bool
+
+    # Encode QR codes in fast mode unless a request says otherwise: the version is looked up from a
+    # precomputed capacity table and a fixed mask pattern is used instead of scoring all eight.
+    qr_fast_encode: bool
+
+    # Mask pattern (0-7) applied in fast mode.
+    qr_fast_mask_pattern: int
+
+    # zlib compression level (0-9) for PNG output. Up to a scale of about 20, level 6 is as small as 9 in a
+    # quarter to a half of the time; at the largest scales 9 saves about a third of the bytes (2.3 KB against
+    # 3.3 KB at 40) for twice the time. See benchmarks/format_report.py.
+    qr_png_compression: int
+
+    # Output format used when a request neither sets `format` nor asks for an image type in its Accept header.
+    qr_default_format: str
+
+    # fsync stored QR images (and their directory) before they become visible, so a crash cannot leave a truncated file.
+    qr_storage_fsync: bool
+
+    # Age in seconds after which a cross-process render claim is considered abandoned and may be taken over.
+    qr_claim_stale_seconds: float
+
+    # Maximum number of verified access tokens remembered so repeat requests skip signature checks.
+    token_cache_size: int
+
+    # Fraction of requests (0.0-1.0) run under cProfile; 0 disables profiling.
+    profile_sample_rate: float
+
+    # Sampled requests slower than this many milliseconds have their profile saved.
+    profile_slow_ms: float
+
+    # Directory receiving saved request profiles.
+    profile_directory: Path
+
+    # Import the QR rendering and JWT libraries while the application starts instead of on first use.
+    # Off by default so workers boot quickly; the first render or token check then pays for the imports.
+    qr_preload: bool
+
+    # Where QR images are kept: 'directory' stores one file per image in QR_STORAGE_PATH (served by nginx),
+    # 'segments' packs them into large append-only segment files there, read back through mmap.
+    # The segment files and their offset index belong to a single process, so 'segments' requires
+    # WEB_CONCURRENCY=1 (one uvicorn or gunicorn worker); multi-worker deployments use 'directory'.
+    qr_storage_backend: str
+
+    # Size, in megabytes, at which the segment backend starts a new segment file.
+    qr_segment_max_mb: float
+
+    # Share of dead bytes (deleted or overwritten images) at which a sealed segment is compacted.
+    qr_compaction_ratio: float
+
+    # Seconds between background compaction passes of the segment backend.
+    qr_compaction_interval_seconds: float
+
+    # Longest pause, in seconds, between expiry sweeps; the sweeper wakes earlier when a code is due.
+    qr_sweep_interval_seconds: float
+
+    # Number of expired codes the sweeper reads from the index per batch.
+    qr_sweep_batch_size: int
+
+    # Upper bound on expired codes deleted per second, so cleanup never competes with requests for I/O (0 = unlimited).
+    qr_sweep_deletes_per_second: float
+
+    # Hand log records to a background thread that formats and writes them, instead of writing from the event loop.
+    log_queue: bool
+
+    # Per-logger caps in records per second, e.g. 'app.routers.qr_code=20,root=500'. Children inherit their parent's cap.
+    log_rate_limits: Mapping[str, float]
 
-# Configuration Variables
+    # Per-logger fraction (0.0-1.0) of DEBUG/INFO records kept, e.g. 'app.routers.qr_code=0.1'. Warnings are always kept.
+    log_sample_rates: Mapping[str, float]
 
-# The storage location for QR code images, falling back to a default if not set.
-QR_STORAGE_PATH = Path(os.getenv('QR_STORAGE_DIRECTORY', 'qr_codes_storage'))
 
-# QR code's primary color setting, defaulting to 'crimson' if not set.
-QR_CODE_COLOR = os.getenv('QR_CODE_COLOR', 'crimson')
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
 
-# Background color for QR code, with a fallback default color of 'offwhite'.
-QR_BACKGROUND_HUE = os.getenv('QR_BACKGROUND_HUE', 'offwhite')
 
-# The root URL for the service, utilized for crafting response URLs.
-# It defaults to the local server address on port 80.
-SERVICE_ROOT_URL = os.getenv('SERVICE_ROOT_URL', 'http://127.0.0.1:80')
+def _per_logger(name: str) -> Mapping[str, float]:
+    # Parses 'logger=value,logger=value' into a read-only mapping, so the frozen settings stay unchanged.
+    pairs = (item.split('=', 1) for item in os.getenv(name, '').split(',') if item.strip())
+    return MappingProxyType({logger.strip(): float(value) for logger, value in pairs})
 
-# Directory for stored files accessible for client download, such as QR code images.
-FILE_SERVE_DIRECTORY = os.getenv('FILE_SERVE_DIRECTORY', 'file_downloads')
 
-# The secret key for secure operations, like JWT token signing, should remain confidential.
-SECRET_KEY = os.getenv("SECRET_KEY", "change-this-secret")
+def load_settings() -> Settings:
+    """
+    Build the settings from the environment.
 
-# Preferred method for encoding and decoding JWT tokens.
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+    Values from a .env file are loaded first, without overriding variables that are already set.
+    This keeps configuration separate from the codebase.
+    """
+    load_dotenv()
+    storage_path = Path(os.getenv('QR_STORAGE_DIRECTORY', 'qr_codes_storage'))
+    web_concurrency = max(int(os.getenv('WEB_CONCURRENCY', 1)), 1)
+    loaded = Settings(
+        qr_storage_path=storage_path,
+        qr_code_color=os.getenv('QR_CODE_COLOR', 'crimson'),
+        qr_background_hue=os.getenv('QR_BACKGROUND_HUE', 'offwhite'),
+        service_root_url=os.getenv('SERVICE_ROOT_URL', 'http://127.0.0.1:80'),
+        file_serve_directory=os.getenv('FILE_SERVE_DIRECTORY', 'downloads'),
+        qr_download_accel_prefix=os.getenv('QR_DOWNLOAD_ACCEL_PREFIX', ''),
+        secret_key=os.getenv("SECRET_KEY", "change-this-secret"),
+        algorithm=os.getenv("ALGORITHM", "HS256"),
+        token_lifetime_minutes=int(os.getenv("TOKEN_LIFETIME_MINUTES", 30)),
+        admin_user=os.getenv('ADMIN_USER', 'admin'),
+        admin_password=os.getenv('ADMIN_PASSWORD', 'secret'),
+        web_concurrency=web_concurrency,
+        render_workers=int(os.getenv('RENDER_WORKERS', max((os.cpu_count() or 1) // web_concurrency, 1))),
+        render_queue_depth=int(os.getenv('RENDER_QUEUE_DEPTH', 64)),
+        admission_max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', 0)),
+        admission_max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', 64)),
+        admission_queue_deadline_seconds=float(os.getenv('ADMISSION_QUEUE_DEADLINE_SECONDS', 10)),
+        admission_client_share=float(os.getenv('ADMISSION_CLIENT_SHARE', 0)),
+        image_cache_mb=float(os.getenv('IMAGE_CACHE_MB', 64)),
+        qr_index_path=Path(os.getenv('QR_INDEX_PATH', str(storage_path.parent / f"{storage_path.name}.sqlite3"))),
+        qr_fast_raster=_flag('QR_FAST_RASTER', 'true'),
+        qr_fast_encode=_flag('QR_FAST_ENCODE', 'false'),
+        qr_fast_mask_pattern=int(os.getenv('QR_FAST_MASK_PATTERN', 0)),
+        qr_png_compression=int(os.getenv('QR_PNG_COMPRESSION', 6)),
+        qr_default_format=os.getenv('QR_DEFAULT_FORMAT', 'png'),
+        qr_storage_fsync=_flag('QR_STORAGE_FSYNC', 'true'),
+        qr_claim_stale_seconds=float(os.getenv('QR_CLAIM_STALE_SECONDS', 30)),
+        token_cache_size=int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+        profile_sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+        profile_slow_ms=float(os.getenv('PROFILE_SLOW_MS', 500)),
+        profile_directory=Path(os.getenv('PROFILE_DIRECTORY', 'profiles')),
+        qr_preload=_flag('QR_PRELOAD', 'false'),
+        qr_storage_backend=os.getenv('QR_STORAGE_BACKEND', 'directory'),
+        qr_segment_max_mb=float(os.getenv('QR_SEGMENT_MAX_MB', 64)),
+        qr_compaction_ratio=float(os.getenv('QR_COMPACTION_RATIO', 0.5)),
+        qr_compaction_interval_seconds=float(os.getenv('QR_COMPACTION_INTERVAL_SECONDS', 300)),
+        qr_sweep_interval_seconds=float(os.getenv('QR_SWEEP_INTERVAL_SECONDS', 30)),
+        qr_sweep_batch_size=int(os.getenv('QR_SWEEP_BATCH_SIZE', 100)),
+        qr_sweep_deletes_per_second=float(os.getenv('QR_SWEEP_DELETES_PER_SECOND', 50)),
+        log_queue=_flag('LOG_QUEUE', 'true'),
+        log_rate_limits=_per_logger('LOG_RATE_LIMITS'),
+        log_sample_rates=_per_logger('LOG_SAMPLE_RATES'),
+    )
+    for variable, color in (('QR_CODE_COLOR', loaded.qr_code_color), ('QR_BACKGROUND_HUE', loaded.qr_background_hue)):
+        try:
+            resolve_color(color)
+        except ValueError:
+            raise ValueError(f"{variable}={color!r} is not a color name or '#rgb' / '#rrggbb' hex value") from None
+    if loaded.qr_storage_backend == 'segments' and loaded.web_concurrency > 1:
+        raise ValueError(f"QR_STORAGE_BACKEND=segments can only be used by one process, but WEB_CONCURRENCY is "
+                         f"{loaded.web_concurrency}; run a single worker or use QR_STORAGE_BACKEND=directory")
+    return loaded
 
-# Lifespan of an access token, expressed in minutes, with a default of 30 minutes.
-TOKEN_LIFETIME_MINUTES = int(os.getenv("TOKEN_LIFETIME_MINUTES", 30))
 
-# Sample administrator credentials for the demonstration.
-# In a live system, replace with a secure authentication system.
-ADMIN_USER = os.getenv('ADMIN_USER', 'admin')
-ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'secret')
+# Loaded exactly once per process; read configuration as `settings.<field>`.
+settings = load_settings()
@@ -1,23 +1,58 @@
 
 
-from fastapi import FastAPI
-from app.config import QR_STORAGE_PATH as QR_PATH
-from app.routers import qr_code,oauth # Adjust according to project layout
+from app.utils import startup  # Imported first: starts the cold-start clock reported at /metrics.
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from app.config import settings
+from app.routers import qr_code,oauth,metrics,downloads # Adjust according to project layout
 from app.services.qr_service import establish_directory_if_missing as ensure_dir_exists
+from app.services.admission import Overloaded
+from app.services.qr_storage import qr_storage
+from app.services.expiry_sweeper import expiry_sweeper
+from app.services.render_engine import render_engine
+from app.services.qr_index import qr_index
 from app.utils.common import initialize_logging as init_logs
+from app.utils.metrics import MetricsMiddleware
+
+logger = logging.getLogger(__name__)
 
 # Initializes the application's logging system using predefined settings.
 # Essential for tracking application behavior and troubleshooting issues.
 init_logs()
 
 # Verifies and creates, if necessary, the directory for QR code storage at application startup.
-ensure_dir_exists(QR_PATH)
+ensure_dir_exists(settings.qr_storage_path)
+
+# Opens the configured storage backend, cleaning up after writes interrupted by a crash.
+qr_storage.open()
+
+# Opens the index, starts the render workers and the background storage and expiry tasks, and stops them on shutdown.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.qr_preload:
+        startup.preload()
+    await asyncio.to_thread(qr_index.open)
+    await render_engine.warm_up()
+    background_tasks = [asyncio.create_task(qr_storage.maintain()), asyncio.create_task(expiry_sweeper.run())]
+    startup.mark("ready")
+    timings = startup.stats()
+    logger.info("Application ready in %.0f ms (imports took %.0f ms)", timings['ready_seconds'] * 1000, timings['imported_seconds'] * 1000)
+    yield
+    for task in background_tasks:
+        task.cancel()
+    render_engine.shutdown()
+    qr_index.close()
+    qr_storage.close()
 
 # Constructing the core FastAPI app object with metadata.
 app = FastAPI(
     title="QR Code Operations",
     description="A service for managing QR code generation, retrieval, and deletion, with OAuth integration for protected access.",
     version="1.0.0",
+    lifespan=lifespan,
         redoc_url=None,  # Disabling Redoc documentation endpoint
     contact={
         "name": "Support Team",
@@ -34,3 +69,22 @@ app = FastAPI(
 # Each router governs a distinct section of the API's functionality.
 app.include_router(qr_code.qr_router)  # Incorporating QR code-related routes
 app.include_router(oauth.security_router)  # Incorporating authentication routes
+app.include_router(downloads.download_router)  # Incorporating stored image downloads
+app.include_router(metrics.metrics_router)  # Incorporating the Prometheus metrics endpoint
+
+# Renders refused by admission control: tell the client when capacity is expected to be free again.
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, error: Overloaded):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "Service overloaded, retry later."},
+                        headers={"Retry-After": str(error.retry_after)})
+
+# Per-endpoint latency and status counters, with optional sampled profiling of slow requests.
+app.add_middleware(
+    MetricsMiddleware,
+    profile_sample_rate=settings.profile_sample_rate,
+    profile_slow_seconds=settings.profile_slow_ms / 1000,
+    profile_dir=settings.profile_directory,
+)
+
+# Everything above ran at import time; the lifespan above reports the time until the app is ready.
+startup.mark("imported")
@@ -0,0 +1,120 @@
+import asyncio
+import re
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status as response_status
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.routers.oauth import get_current_user
+from app.schema import TokenIdentity
+from app.services.qr_formats import QR_FORMATS
+from app.services.qr_index import qr_index
+from app.services.qr_service import QR_FILE_EXTENSIONS, content_etag
+from app.services.qr_storage import qr_storage
+
+download_router = APIRouter()
+
+# A link naming the current version (?v=<etag>, see download_url) always gets the same bytes, so clients may keep them for a year.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Any other link may get new bytes after the code is deleted and re-created with other options, so clients revalidate (cheaply, via 304).
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+_MEDIA_TYPES = {extension: media_type for media_type, extension in QR_FORMATS.values()}
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: a W/ prefix on either side is ignored.
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpret a Range header against a representation of `size` bytes.
+
+    Only a single byte range is supported; anything else (several ranges, other units,
+    malformed values) is ignored, which means sending the whole image as permitted by RFC 9110.
+
+    Returns:
+    - The first and last byte positions (inclusive), or None to send the whole image.
+
+    Raises:
+    - ValueError when the range cannot be satisfied (416).
+    """
+    match = _BYTE_RANGE.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - suffix_length, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError("Range starts past the end of the image")
+    last = int(last) if last else size - 1
+    return first, min(last, size - 1)
+
+
+@download_router.get(f"/{settings.file_serve_directory}/{{qr_img_name}}", tags=["QR Codes"], response_class=Response,
+                     responses={200: {"content": {media_type: {} for media_type, _ in QR_FORMATS.values()}}, 206: {}, 304: {}, 416: {}})
+async def download_qr_code(qr_img_name: str, request: Request, current_user: TokenIdentity = Depends(get_current_user)):
+    """
+    Send a stored QR code image.
+
+    Responses carry a strong, content-derived ETag; they are marked immutable when the `v` query
+    parameter names the current version, and must be revalidated otherwise. If-None-Match is
+    answered with 304 and a single-range Range header with 206. With
+    QR_DOWNLOAD_ACCEL_PREFIX set, nginx sends the file through X-Accel-Redirect instead.
+    """
+    # Hidden names are temporary files and claims, never QR codes.
+    if qr_img_name.startswith(".") or not qr_img_name.endswith(QR_FILE_EXTENSIONS):
+        raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
+    entry = await asyncio.to_thread(qr_index.get, qr_img_name)
+    if entry is None:
+        raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
+    try:
+        size, _ = await asyncio.to_thread(qr_storage.stat, qr_img_name)
+        etag = entry["etag"]
+        if etag is None:
+            etag = content_etag(bytes(await asyncio.to_thread(qr_storage.read, qr_img_name)))
+            await asyncio.to_thread(qr_index.set_etag, qr_img_name, etag)
+    except FileNotFoundError:
+        raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
+
+    media_type = _MEDIA_TYPES["." + qr_img_name.rsplit(".", 1)[-1]]
+    cache_control = IMMUTABLE_CACHE_CONTROL if request.query_params.get("v") == etag.strip('"') else REVALIDATE_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=response_status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    file_path = qr_storage.path(qr_img_name)
+    if settings.qr_download_accel_prefix and file_path is not None:
+        # nginx streams the file, Range requests included, from its internal location.
+        return Response(media_type=media_type, headers={**headers, "X-Accel-Redirect": f"{settings.qr_download_accel_prefix}{qr_img_name}"})
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    # If-Range makes the range conditional: a different tag means the client's partial copy is stale.
+    if range_header is not None and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(status_code=response_status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                            headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        if file_path is not None:
+            return FileResponse(file_path, media_type=media_type, headers=headers)
+        image = await asyncio.to_thread(qr_storage.read, qr_img_name)
+        return Response(content=bytes(image), media_type=media_type, headers=headers)
+    first, last = byte_range
+    image = await asyncio.to_thread(qr_storage.read, qr_img_name)
+    return Response(content=bytes(memoryview(image)[first:last + 1]), status_code=response_status.HTTP_206_PARTIAL_CONTENT,
+                    media_type=media_type, headers={**headers, "Content-Range": f"bytes {first}-{last}/{size}"})
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.routers.qr_code import create_flights
+from app.services.admission import admission
+from app.services.png_cache import png_cache
+from app.services.qr_service import claim_stats
+from app.services.qr_storage import qr_storage
+from app.services.render_engine import render_engine
+from app.utils import startup
+from app.utils.metrics import registry, render_gauges
+from app.utils.token_cache import verified_tokens
+
+metrics_router = APIRouter()
+
+# Prometheus scrape endpoint. It is not authenticated, so keep it off the public proxy (see nginx.conf).
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def export_metrics():
+    return PlainTextResponse(
+        registry.render()
+        + render_gauges("qr_image_cache", png_cache.stats())
+        + render_gauges("qr_token_cache", verified_tokens.stats())
+        + render_gauges("qr_create_single_flight", create_flights.stats())
+        + render_gauges("qr_create_claims", claim_stats)
+        + render_gauges("qr_render_engine", render_engine.stats())
+        + render_gauges("qr_admission", admission.stats())
+        + render_gauges("qr_startup", startup.stats())
+        + render_gauges("qr_storage", qr_storage.stats()),
+        media_type="text/plain; version=0.0.4",
+    )
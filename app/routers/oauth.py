@@ -2,13 +2,37 @@
 from fastapi import APIRouter, Depends, HTTPException, status as http_status
 from fastapi.security import OAuth2PasswordBearer as OAuth2Bearer, OAuth2PasswordRequestForm as OAuth2LoginForm
 from datetime import timedelta as time_delta
-from app.config import TOKEN_LIFETIME_MINUTES
-from app.schema import AuthToken
-from app.utils.common import verify_credentials , issue_token
+from app.config import settings
+from app.schema import AuthToken, TokenIdentity
+from app.utils.common import verify_credentials , issue_token, decode_token
+from app.utils.token_cache import verified_tokens
+import time
 
 # Set up the OAuth2 Bearer token mechanism, with an endpoint for acquiring the token
 token_retriever = OAuth2Bearer(tokenUrl="token")
 
+# Dependency guarding protected routes: verifies the bearer token and returns its identity.
+# Tokens that were already verified are served from a cache until they expire.
+async def get_current_user(token: str = Depends(token_retriever)) -> TokenIdentity:
+    invalid_token = HTTPException(
+        status_code=http_status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    claims = verified_tokens.get(token)
+    if claims is None:
+        verification_started = time.perf_counter()
+        try:
+            claims = decode_token(token)
+        except ValueError:
+            raise invalid_token
+        finally:
+            verified_tokens.record_verification(time.perf_counter() - verification_started)
+        verified_tokens.put(token, claims)
+    if not claims.get("sub"):
+        raise invalid_token
+    return TokenIdentity(user_identifier=claims["sub"])
+
 # Establish an APIRouter instance for routing security endpoints
 security_router = APIRouter()
 
@@ -27,7 +51,7 @@ async def get_access_token(credentials: OAuth2LoginForm = Depends()):
         )
     
     # Set the validity duration of the token using the application's configuration settings
-    token_validity_period = time_delta(minutes=TOKEN_LIFETIME_MINUTES)
+    token_validity_period = time_delta(minutes=settings.token_lifetime_minutes)
     
     # Token creation for the authenticated user
     token = issue_token(
@@ -1,67 +1,317 @@
-from fastapi import APIRouter, HTTPException, Depends, Response, status as response_status
-from fastapi.responses import JSONResponse as JsonResponse
-from fastapi.security import OAuth2PasswordBearer as OAuth2Bearer
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status as response_status
+from fastapi.responses import JSONResponse as JsonResponse, StreamingResponse
+from pydantic import PositiveInt, ValidationError
+from typing import Any, AsyncIterator, Iterator, List, Literal, Optional, Tuple
 
-from app.schema import EncodeURLRequest as QRRequest, QRCodeCreationResponse as QRResponse
-from app.services.qr_service import create_qr_image, retrieve_qr_file_names, remove_qr_image
-from app.utils.common import base64_to_url, url_to_safe_string, craft_resource_links
-from app.config import QR_STORAGE_PATH, QR_CODE_COLOR, QR_BACKGROUND_HUE, SERVICE_ROOT_URL, FILE_SERVE_DIRECTORY
+from app.schema import EncodeURLRequest as QRRequest, QRCodeCreationResponse as QRResponse, BatchItemResult, BulkExpireResult, TokenIdentity
+from app.routers.oauth import get_current_user
+from app.services.qr_service import build_qr_matrix, content_etag, download_url, render_qr_image, claim_qr_name, release_qr_claim
+from app.services.qr_storage import qr_storage
+from app.services.admission import Overloaded, admission, render_cost
+from app.services.single_flight import SingleFlight
+from app.utils.metrics import registry, stage
+from app.services.qr_formats import QR_FORMATS, negotiate_format, svg_chunks
+from app.services.qr_export import export_archive_chunks, select_names
+from app.services.qr_index import qr_index
+from app.services.png_cache import png_cache
+from app.services.render_engine import render_engine
+from app.utils.common import base64_to_url, url_to_safe_string, craft_resource_links, confirm_and_clean_url
+from app.config import settings
 
+import asyncio
+import binascii
+import json
 import logging
+import time
+from datetime import datetime, timezone
 
 qr_router = APIRouter()
-auth_scheme = OAuth2Bearer(tokenUrl="token")
+logger = logging.getLogger(__name__)
+registry.describe("qr_batch_items_total", "Batch items processed, by the status each would have received.")
+
+# Coalesces concurrent create requests for the same QR code name within this worker.
+create_flights = SingleFlight()
+
+def _expiry_of(payload: QRRequest) -> Optional[float]:
+    # Unix timestamp after which the sweeper deletes the code; naive datetimes are taken as UTC.
+    if payload.ttl_seconds is not None:
+        return time.time() + payload.ttl_seconds
+    if payload.expires_at is not None:
+        expires_at = payload.expires_at
+        return (expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)).timestamp()
+    return None
+
+async def _render_and_store(payload: QRRequest, qr_img_name: str, output_format: str, client: Optional[str]) -> Optional[str]:
+    """
+    Render and store one QR code while holding its cross-process claim.
+    Returns the stored image's etag, or None when another worker process holds the claim or has already stored the code.
+    Raises Overloaded when admission control refuses the render.
+    """
+    claim = await claim_qr_name(qr_storage.claim_target(qr_img_name))
+    if claim is None:
+        return None
+    try:
+        # Another worker may have finished between our duplicate check and taking the claim.
+        if await asyncio.to_thread(qr_index.exists, qr_img_name):
+            return None
+        fast_encode = settings.qr_fast_encode if payload.fast_encode is None else payload.fast_encode
+        cache_key = png_cache.make_key(str(payload.target_url), settings.qr_code_color, settings.qr_background_hue, payload.dimensions, payload.error_correction, fast_encode, output_format)
+        # Recently rendered codes, e.g. deleted and recreated, come from the cache and only need writing.
+        image_bytes = png_cache.get(cache_key)
+        if image_bytes is None:
+            # Rendering is CPU bound, so it runs on the render pool instead of the event loop.
+            async with admission.admit(render_cost(str(payload.target_url), payload.dimensions), client):
+                image_bytes = await render_engine.run(render_qr_image, str(payload.target_url), settings.qr_code_color, settings.qr_background_hue,
+                                                      payload.dimensions, payload.error_correction, fast_encode, output_format)
+            png_cache.put(cache_key, image_bytes)
+        etag = content_etag(image_bytes)
+        await qr_storage.put(qr_img_name, image_bytes)
+        await asyncio.to_thread(qr_index.add, qr_img_name, str(payload.target_url), settings.qr_code_color, settings.qr_background_hue, payload.dimensions,
+                                len(image_bytes), _expiry_of(payload), etag)
+        return etag
+    finally:
+        await release_qr_claim(claim)
+
+async def create_qr_code_entry(payload: QRRequest, accept: Optional[str] = None, client: Optional[str] = None) -> Tuple[int, Any]:
+    """
+    Validate, deduplicate and render a single QR code request.
+
+    Concurrent requests for the same name are coalesced: only one of them renders, in
+    this process and across worker processes, and every other caller gets a 409.
+
+    Arguments:
+    - payload (QRRequest): The validated creation request.
+    - accept (str): The request's Accept header, used when the payload does not set a format.
+    - client (str): The requesting token's subject, for fair sharing of render admission.
+
+    Returns:
+    - A tuple of the HTTP status and either a QRResponse (201) or an error body (400/409).
+    """
+    try:
+        # Convert to string when passing to the url_to_safe_string function
+        safe_filename = url_to_safe_string(str(payload.target_url))
+    except ValueError:
+        return response_status.HTTP_400_BAD_REQUEST, {"detail": "Invalid URL provided"}
+
+    output_format = negotiate_format(accept, payload.format, settings.qr_default_format)
+    media_type, extension = QR_FORMATS[output_format]
+    qr_img_name = f"{safe_filename}{extension}"
+    duplicate = response_status.HTTP_409_CONFLICT, {
+        "detail": "Duplicate QR code.",
+        "links": craft_resource_links("create", qr_img_name, settings.service_root_url, download_url(qr_img_name), media_type),
+    }
+
+    if await asyncio.to_thread(qr_index.exists, qr_img_name):
+        logger.info("QR already generated.")
+        return duplicate
+    etag, shared = await create_flights.do(qr_img_name, lambda: _render_and_store(payload, qr_img_name, output_format, client))
+    if shared or etag is None:
+        logger.info("QR generated by a concurrent request.")
+        return duplicate
+    with stage("response_build"):
+        # The link carries the image's version, so it may be cached for good (see the downloads router).
+        qr_link = download_url(qr_img_name, etag)
+        resource_links = craft_resource_links("create", qr_img_name, settings.service_root_url, qr_link, media_type)
+        return response_status.HTTP_201_CREATED, QRResponse(notice="Generated QR code.", qr_link=qr_link, navigation_links=resource_links)
 
 @qr_router.post("/qr-codes/", response_model=QRResponse, status_code=response_status.HTTP_201_CREATED, tags=["QR Codes"])
-async def generate_qr_code(payload: QRRequest, token: str = Depends(auth_scheme)):
-    logging.info(f"Request received to generate QR for: {str(payload.target_url)}")  # Convert to string for logging
-
-    # Convert to string when passing to the url_to_safe_string function
-    safe_filename = url_to_safe_string(str(payload.target_url))
-    if not safe_filename:
-        return JsonResponse(
-            status_code=response_status.HTTP_400_BAD_REQUEST,
-            content={"detail": "Invalid URL provided"}
-        )
-    
-    qr_img_name = f"{safe_filename}.png"
-    full_qr_path = QR_STORAGE_PATH / qr_img_name
-    download_url = f"{SERVICE_ROOT_URL}/{FILE_SERVE_DIRECTORY}/{qr_img_name}"
-    resource_links = craft_resource_links("create", qr_img_name, SERVICE_ROOT_URL, download_url)
-    
-    if full_qr_path.exists():
-        logging.info("QR already generated.")
-        return JsonResponse(
-            status_code=response_status.HTTP_409_CONFLICT,
-            content={"detail": "Duplicate QR code.", "links": resource_links}
-        )
-
-    create_qr_image(str(payload.target_url), full_qr_path, QR_CODE_COLOR, QR_BACKGROUND_HUE, payload.dimensions)
-    return QRResponse(notice="Generated QR code.", qr_link=download_url, navigation_links=resource_links)
-
-    
-    create_qr_image(payload.target_url, full_qr_path, QR_CODE_COLOR, QR_BACKGROUND_HUE, payload.dimensions)
-    return QRResponse(notice="Generated QR code.", qr_link=download_url, navigation_links=resource_links)
+async def generate_qr_code(payload: QRRequest, request: Request, current_user: TokenIdentity = Depends(get_current_user)):
+    logger.info("Request received to generate QR for: %s", payload.target_url)
+    status_code, content = await create_qr_code_entry(payload, accept=request.headers.get("accept"), client=current_user.user_identifier)
+    if status_code != response_status.HTTP_201_CREATED:
+        return JsonResponse(status_code=status_code, content=content)
+    return content
+
+async def _batch_item_result(index: int, raw_item: Any, accept: Optional[str], client: Optional[str]) -> BatchItemResult:
+    result = await _create_batch_item(index, raw_item, accept, client)
+    registry.inc("qr_batch_items_total", status=str(result.status_code))
+    return result
+
+async def _create_batch_item(index: int, raw_item: Any, accept: Optional[str], client: Optional[str]) -> BatchItemResult:
+    try:
+        payload = QRRequest.model_validate(raw_item)
+    except ValidationError as error:
+        return BatchItemResult(index=index, status_code=response_status.HTTP_400_BAD_REQUEST, detail=error.errors(include_url=False, include_context=False))
+    try:
+        status_code, content = await create_qr_code_entry(payload, accept, client)
+    except Overloaded:
+        return BatchItemResult(index=index, status_code=response_status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service overloaded, retry later.")
+    except Exception as error:
+        logger.error("Batch item %d failed to render: %s", index, error)
+        return BatchItemResult(index=index, status_code=response_status.HTTP_500_INTERNAL_SERVER_ERROR, detail="QR code rendering failed.")
+    if status_code == response_status.HTTP_201_CREATED:
+        return BatchItemResult(index=index, status_code=status_code, result=content)
+    return BatchItemResult(index=index, status_code=status_code, **content)
+
+def _read_batch_items(body: bytes, content_type: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Split a batch body into raw items, either a JSON array or one JSON document per line.
+    A line that is not valid JSON is passed through as-is so it is reported as a 400 for that item only.
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        index = 0
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError:
+                yield index, line.decode("utf-8", errors="replace")
+            index += 1
+        return
+    items = json.loads(body)
+    if not isinstance(items, list):
+        raise ValueError("Batch body must be a JSON array")
+    yield from enumerate(items)
+
+async def _stream_batch_results(items: Iterator[Tuple[int, Any]], accept: Optional[str], client: Optional[str]) -> AsyncIterator[str]:
+    # Keep only as many items in flight as the render engine can run or queue, so memory
+    # stays bounded no matter how large the batch is.
+    concurrency = max(render_engine.workers, 1) + render_engine.queue_depth
+    in_flight = set()
+    for index, raw_item in items:
+        in_flight.add(asyncio.ensure_future(_batch_item_result(index, raw_item, accept, client)))
+        if len(in_flight) >= concurrency:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result().model_dump_json() + "\n"
+    while in_flight:
+        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result().model_dump_json() + "\n"
+
+@qr_router.post("/qr-codes/batch", tags=["QR Codes"], response_class=StreamingResponse, responses={200: {"content": {"application/x-ndjson": {}}}})
+async def generate_qr_code_batch(request: Request, current_user: TokenIdentity = Depends(get_current_user)):
+    """
+    Create many QR codes in one call. The body is either a JSON array of QR code requests
+    or an NDJSON upload (Content-Type: application/x-ndjson). One result is streamed back
+    per line as soon as its item finishes, so results are not in submission order.
+    """
+    # The body has to be read before streaming starts; the response task listens on the same channel.
+    body = await request.body()
+    try:
+        items = list(_read_batch_items(body, request.headers.get("content-type", "")))
+    except ValueError:
+        raise HTTPException(status_code=response_status.HTTP_400_BAD_REQUEST, detail="Batch body must be a JSON array or NDJSON")
+    logger.info("Request received to generate a batch of %d QR codes", len(items))
+    return StreamingResponse(_stream_batch_results(iter(items), request.headers.get("accept"), current_user.user_identifier),
+                             media_type="application/x-ndjson")
 
 @qr_router.get("/qr-codes/", response_model=List[QRResponse], tags=["QR Codes"])
-async def show_all_qr_codes(token: str = Depends(auth_scheme)):
-    logging.info("Generating list of all available QRs.")
-    qr_code_files = retrieve_qr_file_names(QR_STORAGE_PATH)
-    responses = [
-        QRResponse(
-            notice="QR code ready for use.",
-            qr_link=base64_to_url(qr[:-4]),
-            navigation_links=craft_resource_links("list", qr, SERVICE_ROOT_URL, f"{SERVICE_ROOT_URL}/{FILE_SERVE_DIRECTORY}/{qr}")
-        ) for qr in qr_code_files
-    ]
+async def show_all_qr_codes(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=1000, description="Maximum number of QR codes to return."),
+    after: Optional[str] = Query(default=None, description="Cursor from the previous page's X-Next-Cursor header."),
+    current_user: TokenIdentity = Depends(get_current_user),
+):
+    entries = await asyncio.to_thread(qr_index.page, limit, after)
+    # Listing is a hot, read-only path: debug level so it stays quiet under normal configuration.
+    logger.debug("Listing %d QR codes after %s", len(entries), after)
+    with stage("response_build"):
+        responses = [
+            QRResponse(
+                notice="QR code ready for use.",
+                qr_link=entry["url"],
+                navigation_links=craft_resource_links("list", entry["name"], settings.service_root_url, download_url(entry["name"], entry["etag"]))
+            ) for entry in entries
+        ]
+    # A full page means there may be more entries; the last name is the cursor for the next one.
+    if len(entries) == limit:
+        response.headers["X-Next-Cursor"] = entries[-1]["name"]
     return responses
 
+@qr_router.delete("/qr-codes/", response_model=BulkExpireResult, status_code=response_status.HTTP_202_ACCEPTED, tags=["QR Codes"])
+async def expire_qr_codes(
+    url_prefix: Optional[str] = Query(default=None, min_length=1, description="Only QR codes whose target URL starts with this text."),
+    older_than: Optional[datetime] = Query(default=None, description="Only QR codes created before this time (UTC unless an offset is given)."),
+    current_user: TokenIdentity = Depends(get_current_user),
+):
+    """
+    Mark every matching QR code as expired. The codes are deleted in the background by
+    the expiry sweeper, at its rate limit, rather than during this request.
+    """
+    if url_prefix is None and older_than is None:
+        raise HTTPException(status_code=response_status.HTTP_400_BAD_REQUEST, detail="Give url_prefix and/or older_than")
+    created_before = None
+    if older_than is not None:
+        created_before = (older_than if older_than.tzinfo else older_than.replace(tzinfo=timezone.utc)).timestamp()
+    marked = await asyncio.to_thread(qr_index.mark_expired, time.time(), url_prefix, created_before)
+    logger.info("Marked %d QR code(s) for expiry", marked)
+    return BulkExpireResult(marked=marked)
+
+# Registered before the image route below, which would otherwise take "export.zip" as a QR code name.
+@qr_router.get("/qr-codes/export.zip", tags=["QR Codes"], response_class=StreamingResponse, responses={200: {"content": {"application/zip": {}}}})
+async def export_qr_codes(
+    name: Optional[List[str]] = Query(default=None, description="Only these QR code file names; may be repeated."),
+    url_prefix: Optional[str] = Query(default=None, min_length=1, description="Only QR codes whose target URL starts with this text."),
+    current_user: TokenIdentity = Depends(get_current_user),
+):
+    """
+    Download stored QR codes as one ZIP archive, with a manifest.csv mapping each file to its target URL.
+    The archive is built while it is sent, so exports of any size need no temporary files.
+    """
+    names = select_names(await asyncio.to_thread(qr_storage.names), name, url_prefix)
+    logger.info("Exporting %d QR code(s)", len(names))
+    return StreamingResponse(export_archive_chunks(qr_storage, names), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="qr-codes.zip"'})
+
+def _stream_and_cache(chunks: Iterator[str], cache_key) -> Iterator[bytes]:
+    # Send each chunk as soon as it is generated and cache the full document once complete.
+    rendered = []
+    for chunk in chunks:
+        encoded = chunk.encode("utf-8")
+        rendered.append(encoded)
+        yield encoded
+    png_cache.put(cache_key, b"".join(rendered))
+
+@qr_router.get("/qr-codes/{qr_name}.{image_format}", tags=["QR Codes"], response_class=Response,
+               responses={200: {"content": {media_type: {} for media_type, _ in QR_FORMATS.values()}}})
+async def get_qr_code_image(
+    qr_name: str,
+    image_format: Literal["png", "svg", "pbm"],
+    dimensions: PositiveInt = Query(default=12, le=40, description="The QR code's scale, ranging between 1 and 40."),
+    error_correction: Literal["L", "M", "Q", "H"] = Query(default="M", description="Error-correction level."),
+    fast_encode: bool = Query(default=settings.qr_fast_encode, description="Use fast encoding (table-based version, fixed mask)."),
+    current_user: TokenIdentity = Depends(get_current_user),
+):
+    """
+    Return the image for an encoded QR code name, rendering it on a cache miss.
+    SVG output is streamed while it is generated.
+    """
+    try:
+        target_url = base64_to_url(qr_name)
+    except (binascii.Error, UnicodeDecodeError):
+        target_url = None
+    if not target_url or not confirm_and_clean_url(target_url):
+        raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
+
+    media_type, _ = QR_FORMATS[image_format]
+    cache_key = png_cache.make_key(target_url, settings.qr_code_color, settings.qr_background_hue, dimensions, error_correction, fast_encode, image_format)
+    image_bytes = png_cache.get(cache_key)
+    if image_bytes is not None:
+        return Response(content=image_bytes, media_type=media_type, headers={"X-Cache": "HIT"})
+    async with admission.admit(render_cost(target_url, dimensions), current_user.user_identifier):
+        if image_format == "svg":
+            matrix = await render_engine.run(build_qr_matrix, target_url, error_correction, fast_encode)
+        else:
+            image_bytes = await render_engine.run(render_qr_image, target_url, settings.qr_code_color, settings.qr_background_hue, dimensions, error_correction, fast_encode, image_format)
+    if image_format == "svg":
+        chunks = svg_chunks(matrix, dimensions, settings.qr_code_color, settings.qr_background_hue)
+        return StreamingResponse(_stream_and_cache(chunks, cache_key), media_type=media_type, headers={"X-Cache": "MISS"})
+    png_cache.put(cache_key, image_bytes)
+    return Response(content=image_bytes, media_type=media_type, headers={"X-Cache": "MISS"})
+
 @qr_router.delete("/qr-codes/{qr_img_name}", status_code=response_status.HTTP_204_NO_CONTENT, tags=["QR Codes"])
-async def remove_qr_code(qr_img_name: str, auth_token: str = Depends(auth_scheme)):
-    logging.info(f"Initiating deletion of QR code: {qr_img_name}.")
-    qr_file_path = QR_STORAGE_PATH / qr_img_name
-    if not qr_file_path.is_file():
+async def remove_qr_code(qr_img_name: str, current_user: TokenIdentity = Depends(get_current_user)):
+    logger.info("Initiating deletion of QR code: %s.", qr_img_name)
+    # Hidden names are temporary files of in-progress writes, never QR codes.
+    if qr_img_name.startswith('.'):
+        raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
+    was_indexed = await asyncio.to_thread(qr_index.remove, qr_img_name)
+    try:
+        await qr_storage.delete(qr_img_name)
+    except FileNotFoundError:
+        if was_indexed:
+            logger.warning("Removed stale index entry for missing QR code file %s", qr_img_name)
         raise HTTPException(status_code=response_status.HTTP_404_NOT_FOUND, detail="Can't locate QR code")
-    remove_qr_image(qr_file_path)
     return Response(status_code=response_status.HTTP_204_NO_CONTENT)
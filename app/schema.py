@@ -1,11 +1,23 @@
-from pydantic import BaseModel, HttpUrl, Field, PositiveInt
-from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, HttpUrl, Field, PositiveInt, model_validator
+from typing import Any, List, Literal, Optional
 
 class EncodeURLRequest(BaseModel):
     target_url: HttpUrl = Field(..., description="The web address to be converted into a QR code.")
     primary_color: str = Field(default="darkred", description="The QR code's primary color.", example="black")
     background_color: str = Field(default="white", description="The color behind the QR code.", example="yellow")
-    dimensions: PositiveInt = Field(default=12, description="The QR code's scale, ranging between 1 and 40.", example=20)
+    dimensions: PositiveInt = Field(default=12, le=40, description="The QR code's scale, ranging between 1 and 40.", example=20)
+    error_correction: Literal["L", "M", "Q", "H"] = Field(default="M", description="Error-correction level; lower levels give smaller, faster codes.", example="L")
+    fast_encode: Optional[bool] = Field(default=None, description="Use fast encoding (table-based version, fixed mask). Defaults to the server setting.", example=True)
+    format: Optional[Literal["png", "svg", "pbm"]] = Field(default=None, description="Output format. Defaults to the Accept header, then the server setting.", example="svg")
+    ttl_seconds: Optional[PositiveInt] = Field(default=None, description="Delete the QR code this many seconds after creation.", example=86400)
+    expires_at: Optional[datetime] = Field(default=None, description="Delete the QR code at this time (UTC unless an offset is given).", example="2030-01-01T00:00:00Z")
+
+    @model_validator(mode="after")
+    def single_expiry(self):
+        if self.ttl_seconds is not None and self.expires_at is not None:
+            raise ValueError("Set either ttl_seconds or expires_at, not both.")
+        return self
 
     class Config:
         schema_extra = {
@@ -13,7 +25,10 @@ class EncodeURLRequest(BaseModel):
                 "target_url": "https://yourwebsite.com",
                 "primary_color": "black",
                 "background_color": "yellow",
-                "dimensions": 20
+                "dimensions": 20,
+                "error_correction": "M",
+                "fast_encode": True,
+                "format": "png"
             }
         }
 
@@ -75,3 +90,30 @@ class TokenIdentity(BaseModel):
                 "user_identifier": "uniqueuser@yourwebsite.com"
             }
         }
+
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item within the submitted batch.")
+    status_code: int = Field(..., description="HTTP status the item would have received as a single request.")
+    result: Optional[QRCodeCreationResponse] = Field(None, description="Creation details when the QR code was generated.")
+    detail: Optional[Any] = Field(None, description="Reason the item was not generated.")
+    links: List[ResourceLink] = Field(default=[], description="Links to the existing QR code for duplicates.")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "index": 0,
+                "status_code": 409,
+                "detail": "Duplicate QR code.",
+                "links": []
+            }
+        }
+
+class BulkExpireResult(BaseModel):
+    marked: int = Field(..., description="Number of QR codes marked for deletion by the expiry sweeper.")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "marked": 42
+            }
+        }
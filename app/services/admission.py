@@ -0,0 +1,174 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.metrics import registry
+
+registry.describe("qr_admission_wait_seconds", "Time renders waited for admission.")
+registry.describe("qr_admission_shed_total", "Renders refused by admission control, by reason.")
+
+# Weight of the latest render in the moving average of render seconds per cost unit.
+_SPEED_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """
+    Raised when a render is refused by admission control; answered with 503 and Retry-After.
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Render refused ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def render_cost(url: str, dimensions: int) -> float:
+    """
+    Estimated relative cost of rendering a QR code: the module count grows with the URL
+    length and the pixels to write with the square of the scale.
+    """
+    return len(url) * dimensions ** 2
+
+
+class AdmissionController:
+    """
+    Caps the renders running at once and sheds load before the render pool saturates.
+
+    Renders past `max_concurrent` wait in a bounded queue. The expected wait of a new
+    request is estimated from the cost already queued and a moving average of measured
+    render seconds per cost unit; a request that could not start within `queue_deadline`
+    is refused at once with the time after which a retry is likely to succeed, rather
+    than adding to the queue and timing out after occupying it. Refusing early keeps the
+    admitted work finishing in time, so throughput holds at capacity under overload.
+
+    Waiting requests are queued per client (the token subject) and clients are served in
+    turn, so one busy client cannot starve the others; `client_share` additionally caps
+    the share of the queue one client may hold. The controller is per process: with
+    several server workers each admits up to its own limits.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_deadline: float, client_share: float = 0.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_deadline = queue_deadline
+        self.client_share = client_share
+        self.running = 0
+        self.queued = 0
+        self.queued_cost = 0.0
+        self.seconds_per_cost = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+
+    def estimated_wait(self, cost: float) -> float:
+        """
+        Seconds until a render of `cost` queued now would finish, judged by the measured render speed.
+        """
+        return (self.queued_cost + cost) * self.seconds_per_cost / self.max_concurrent
+
+    @asynccontextmanager
+    async def admit(self, cost: float, client: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Hold a render slot for the body of the `async with` block.
+
+        Arguments:
+        - cost (float): The render's estimated cost, see `render_cost`.
+        - client (str): Who asked for the render, for fair sharing of the queue.
+
+        Raises:
+        - Overloaded when the render cannot be admitted within the queue deadline.
+        """
+        await self._acquire(cost, client or "")
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            if cost:
+                speed = elapsed / cost
+                self.seconds_per_cost = speed if not self.seconds_per_cost else (
+                    _SPEED_SMOOTHING * speed + (1 - _SPEED_SMOOTHING) * self.seconds_per_cost)
+            self._release()
+
+    async def _acquire(self, cost: float, client: str):
+        if self.running < self.max_concurrent and not self.queued:
+            self.running += 1
+            self.admitted += 1
+            registry.observe("qr_admission_wait_seconds", 0.0)
+            return
+        estimated_wait = self.estimated_wait(cost)
+        if self.queued >= self.max_queue:
+            self._shed("queue_full", estimated_wait)
+        if estimated_wait > self.queue_deadline:
+            self._shed("deadline", estimated_wait)
+        client_queue = self._queues.get(client)
+        if self.client_share and client_queue and len(client_queue) >= max(1, int(self.client_share * self.max_queue)):
+            self._shed("client_share", estimated_wait)
+
+        waiter = (asyncio.get_running_loop().create_future(), cost)
+        self._queues.setdefault(client, deque()).append(waiter)
+        self.queued += 1
+        self.queued_cost += cost
+        enqueued = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter[0], self.queue_deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter[0].done() and not waiter[0].cancelled():
+                self._release()  # Admitted just as the caller gave up.
+            else:
+                self._dequeue(client, waiter)
+            if isinstance(error, asyncio.TimeoutError):
+                self._shed("timeout", self.estimated_wait(cost))
+            raise
+        self.admitted += 1
+        registry.observe("qr_admission_wait_seconds", time.monotonic() - enqueued)
+
+    def _dequeue(self, client: str, waiter: Tuple[asyncio.Future, float]):
+        client_queue = self._queues.get(client)
+        if client_queue is None or waiter not in client_queue:
+            return
+        client_queue.remove(waiter)
+        if not client_queue:
+            del self._queues[client]
+        self.queued -= 1
+        self.queued_cost -= waiter[1]
+
+    def _release(self):
+        self.running -= 1
+        # Hand freed slots to the next client in turn; a client with more waiting goes to the back.
+        while self.running < self.max_concurrent and self._queues:
+            client, client_queue = next(iter(self._queues.items()))
+            future, cost = client_queue.popleft()
+            if client_queue:
+                self._queues.move_to_end(client)
+            else:
+                del self._queues[client]
+            self.queued -= 1
+            self.queued_cost -= cost
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+
+    def _shed(self, reason: str, estimated_wait: float):
+        self.shed += 1
+        registry.inc("qr_admission_shed_total", reason=reason)
+        raise Overloaded(reason, max(1, math.ceil(estimated_wait - self.queue_deadline)))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queued_cost": self.queued_cost,
+            "seconds_per_cost": self.seconds_per_cost,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+# Shared controller guarding every render started by the routers.
+admission = AdmissionController(settings.admission_max_concurrent or max(settings.render_workers, 1), settings.admission_max_queue,
+                                settings.admission_queue_deadline_seconds, settings.admission_client_share)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.config import settings
+from app.services.qr_index import QRIndex, qr_index
+from app.services.qr_service import claim_qr_name, release_qr_claim
+from app.services.qr_storage import QRStorage, qr_storage
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+registry.describe("qr_expired_deleted_total", "QR codes deleted by the expiry sweeper.")
+
+
+class ExpirySweeper:
+    """
+    Deletes QR codes whose expiry time has passed.
+
+    Expired names are read from the index in expiry order, `batch_size` at a time,
+    and deleted at no more than `deletes_per_second` so a large backlog (e.g. after
+    a bulk expire) cannot starve request traffic of disk I/O. Each code is deleted
+    under the same cross-process claim used when creating it, and only if it is
+    still expired, so sweepers in several workers never race each other or a
+    concurrent re-creation.
+    """
+
+    def __init__(self, index: QRIndex, storage: QRStorage, interval: float, batch_size: int, deletes_per_second: float):
+        self.index = index
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self.deletes_per_second = deletes_per_second
+
+    async def sweep_once(self, now: Optional[float] = None) -> int:
+        """
+        Delete one batch of expired codes.
+
+        Returns:
+        - The number of codes deleted.
+        """
+        now = time.time() if now is None else now
+        deleted = 0
+        for name in await asyncio.to_thread(self.index.expired, now, self.batch_size):
+            claim = await claim_qr_name(self.storage.claim_target(name))
+            if claim is None:
+                continue  # Being created or swept by another worker right now.
+            try:
+                if not await asyncio.to_thread(self.index.remove_if_expired, name, now):
+                    continue
+                try:
+                    await self.storage.delete(name)
+                except FileNotFoundError:
+                    logger.warning("Expired QR code %s was already missing from storage", name)
+            finally:
+                await release_qr_claim(claim)
+            deleted += 1
+            registry.inc("qr_expired_deleted_total")
+            if self.deletes_per_second:
+                await asyncio.sleep(1 / self.deletes_per_second)
+        return deleted
+
+    async def run(self):
+        """
+        Sweep for the lifetime of the application: back to back while batches come back full,
+        otherwise once per interval or when the next code expires, whichever is sooner.
+        """
+        while True:
+            try:
+                deleted = await self.sweep_once()
+            except Exception:
+                logger.exception("Expiry sweep failed")
+                deleted = 0
+            if deleted:
+                logger.info("Deleted %d expired QR code(s)", deleted)
+            if deleted >= self.batch_size:
+                continue
+            next_expiry = await asyncio.to_thread(self.index.next_expiry)
+            delay = self.interval if next_expiry is None else min(self.interval, max(next_expiry - time.time(), 0.0))
+            await asyncio.sleep(max(delay, 0.1))
+
+
+# Sweeper started by the application lifespan.
+expiry_sweeper = ExpirySweeper(qr_index, qr_storage, settings.qr_sweep_interval_seconds, settings.qr_sweep_batch_size, settings.qr_sweep_deletes_per_second)
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from app.config import settings
+
+
+class PNGCache:
+    """
+    Size-bounded LRU cache of rendered image bytes (PNG, SVG or PBM).
+
+    Entries are evicted least-recently-used first once the total size of the
+    cached images exceeds the memory budget. Hit, miss and eviction counts are
+    kept so the cache's effectiveness can be observed. Streamed SVG responses
+    fill the cache from Starlette's threadpool while requests read it on the
+    event loop, so every operation holds a lock.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url: str, qr_color: str, background: str, dimensions: int,
+                 error_correction: str = 'M', fast_encode: bool = False, output_format: str = 'png') -> Hashable:
+        return (url, qr_color, background, dimensions, error_correction, fast_encode, output_format)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """
+        Return the cached image for `key`, or None if it is not cached.
+        """
+        with self._lock:
+            png_bytes = self._entries.get(key)
+            if png_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png_bytes
+
+    def put(self, key: Hashable, png_bytes: bytes):
+        """
+        Cache an image, evicting the least recently used entries to stay within budget.
+        Images larger than the whole budget are not cached.
+        """
+        if len(png_bytes) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = png_bytes
+            self.current_bytes += len(png_bytes)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Shared cache of rendered images, keyed by URL, colors, dimensions and encoding options and format.
+png_cache = PNGCache(int(settings.image_cache_mb * 1024 * 1024))
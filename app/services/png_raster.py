@@ -0,0 +1,73 @@
+import struct
+import zlib
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+# NumPy is imported inside the functions that use it, so importing the service does not pay for it.
+if TYPE_CHECKING:
+    import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# IHDR color types used by the rasterizer.
+_GREYSCALE = 0
+_PALETTE = 3
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def module_rows(matrix: Sequence[Sequence[bool]], box_size: int) -> 'np.ndarray':
+    """
+    Scale a QR module matrix to pixel rows, packed 8 pixels per byte.
+
+    Arguments:
+    - matrix: Rows of booleans as returned by `QRCode.get_matrix()`, True for dark modules (border included).
+    - box_size (int): Number of pixels per module.
+
+    Returns:
+    - A uint8 array of shape (pixel height, packed row width) where a set bit means a light pixel.
+    """
+    import numpy as np
+    light = ~np.asarray(matrix, dtype=bool)
+    # Widen each module to box_size pixels and pack once per module row, then repeat whole
+    # packed rows vertically; this avoids materialising the full pixel grid before packing.
+    packed = np.packbits(np.repeat(light, box_size, axis=1), axis=1)
+    return np.repeat(packed, box_size, axis=0)
+
+
+def encode_png(matrix: Sequence[Sequence[bool]], box_size: int,
+               palette: Optional[Tuple[Tuple[int, int, int], Tuple[int, int, int]]] = None,
+               compress_level: int = 6) -> bytes:
+    """
+    Write a QR module matrix straight to 1-bit PNG bytes.
+
+    Without a palette the image is 1-bit greyscale, pixel-identical to qrcode's PyPNG
+    backend (dark modules black, light modules white). With a palette the image is a
+    2-entry palette PNG, entry 0 being the dark color and entry 1 the light one.
+
+    Arguments:
+    - matrix: Rows of booleans as returned by `QRCode.get_matrix()`.
+    - box_size (int): Number of pixels per module.
+    - palette: Optional (dark RGB, light RGB) pair.
+    - compress_level (int): zlib compression level for the image data.
+
+    Returns:
+    - The encoded PNG as bytes.
+    """
+    import numpy as np
+    rows = module_rows(matrix, box_size)
+    height, width = rows.shape[0], len(matrix[0]) * box_size
+    # Every scanline is prefixed with filter type 0 (None).
+    scanlines = np.zeros((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rows
+    color_type = _GREYSCALE if palette is None else _PALETTE
+    chunks: List[bytes] = [
+        PNG_SIGNATURE,
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, color_type, 0, 0, 0)),
+    ]
+    if palette is not None:
+        chunks.append(_chunk(b"PLTE", bytes(palette[0]) + bytes(palette[1])))
+    chunks.append(_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compress_level)))
+    chunks.append(_chunk(b"IEND", b""))
+    return b"".join(chunks)
@@ -0,0 +1,183 @@
+import binascii
+import csv
+import io
+import itertools
+import logging
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from app.services.qr_storage import QRStorage
+from app.utils.common import base64_to_url
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces stored images are copied into the archive in.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+MANIFEST_NAME = "manifest.csv"
+
+# ZIP record layouts (APPNOTE.TXT 4.3), all little-endian.
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END = struct.Struct("<IHHHHIIH")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_ZIP64_OFFSET_EXTRA = struct.Struct("<HHQ")
+_LOCAL_HEADER_SIGNATURE = 0x04034B50
+_CENTRAL_HEADER_SIGNATURE = 0x02014B50
+_END_SIGNATURE = 0x06054B50
+_ZIP64_END_SIGNATURE = 0x06064B50
+_ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+_ZIP_VERSION = 20
+_ZIP64_VERSION = 45
+_ZIP64_LIMIT = 0xFFFFFFFF
+_STORED = 0
+_UTF8_NAME = 0x800
+
+
+class _StoredZipWriter:
+    """
+    Minimal ZIP writer for STORED entries, producing the archive as a sequence of byte strings.
+
+    zipfile cannot do this on a stream it cannot seek: it then flags every entry as having a
+    data descriptor and leaves the size and CRC in the local header at zero, which readers
+    that stream an archive (e.g. Java's ZipInputStream) reject for STORED entries. Here each
+    entry's data is read twice, once for its size and CRC and once to send it, so its local
+    header is complete. ZIP64 records are added once the archive outgrows the classic format.
+    """
+
+    def __init__(self, date_time: time.struct_time):
+        self.offset = 0
+        self.entries = 0
+        self._dos_time = date_time.tm_hour << 11 | date_time.tm_min << 5 | date_time.tm_sec // 2
+        self._dos_date = (date_time.tm_year - 1980) << 9 | date_time.tm_mon << 5 | date_time.tm_mday
+        self._central_directory: List[bytes] = []
+
+    def add(self, name: str, chunks: Callable[[], Iterable[bytes]]) -> Iterator[bytes]:
+        """
+        Generate one entry. `chunks` is called twice and must return the same bytes both times.
+        """
+        crc, size = 0, 0
+        for chunk in chunks():
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+        encoded_name = name.encode("utf-8")
+        flags = 0 if encoded_name.isascii() else _UTF8_NAME
+        fields = (_STORED, self._dos_time, self._dos_date, crc, size, size, len(encoded_name))
+        yield _LOCAL_HEADER.pack(_LOCAL_HEADER_SIGNATURE, _ZIP_VERSION, flags, *fields, 0) + encoded_name
+        header_offset = self.offset
+        self.offset += _LOCAL_HEADER.size + len(encoded_name)
+        for chunk in chunks():
+            self.offset += len(chunk)
+            yield chunk
+        extra = b""
+        if header_offset >= _ZIP64_LIMIT:
+            extra = _ZIP64_OFFSET_EXTRA.pack(1, 8, header_offset)
+            header_offset = _ZIP64_LIMIT
+        self._central_directory.append(_CENTRAL_HEADER.pack(
+            _CENTRAL_HEADER_SIGNATURE, _ZIP64_VERSION, _ZIP64_VERSION if extra else _ZIP_VERSION, flags, *fields,
+            len(extra), 0, 0, 0, 0, header_offset) + encoded_name + extra)
+        self.entries += 1
+
+    def finish(self) -> bytes:
+        """
+        The central directory and end records, which complete the archive.
+        """
+        directory = b"".join(self._central_directory)
+        self._central_directory.clear()
+        start, size = self.offset, len(directory)
+        trailer = b""
+        if self.entries >= 0xFFFF or start >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+            trailer = (_ZIP64_END.pack(_ZIP64_END_SIGNATURE, _ZIP64_END.size - 12, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                                       self.entries, self.entries, size, start)
+                       + _ZIP64_LOCATOR.pack(_ZIP64_LOCATOR_SIGNATURE, 0, start + size, 1))
+        trailer += _END.pack(_END_SIGNATURE, 0, 0, min(self.entries, 0xFFFF), min(self.entries, 0xFFFF),
+                             min(size, _ZIP64_LIMIT), min(start, _ZIP64_LIMIT), 0)
+        self.offset += size + len(trailer)
+        return directory + trailer
+
+
+def url_of(name: str) -> str:
+    # Stored names are the base64 encoded target URL plus an image extension.
+    try:
+        return base64_to_url(name.rsplit(".", 1)[0])
+    except (binascii.Error, UnicodeDecodeError):
+        return ""
+
+
+def select_names(names: Iterable[str], wanted: Optional[List[str]] = None, url_prefix: Optional[str] = None) -> List[str]:
+    """
+    Filter stored QR code names for an export.
+
+    Arguments:
+    - names: Every stored name.
+    - wanted (list): Only these exact names, when given.
+    - url_prefix (str): Only codes whose target URL starts with this text, when given.
+    """
+    wanted_names = set(wanted) if wanted else None
+    return sorted(name for name in names
+                  if not name.startswith(".")
+                  and (wanted_names is None or name in wanted_names)
+                  and (url_prefix is None or url_of(name).startswith(url_prefix)))
+
+
+@contextmanager
+def _stored_image(storage: QRStorage, name: str) -> Iterator[Callable[[], Iterator[bytes]]]:
+    """
+    Open a stored image for export. Yields a function returning the image in chunks; every call
+    reads the same bytes, even if the code is replaced meanwhile. Raises FileNotFoundError when
+    the code is gone.
+    """
+    path = storage.path(name)
+    if path is not None:
+        with open(path, "rb") as image:
+            def file_chunks() -> Iterator[bytes]:
+                image.seek(0)
+                while chunk := image.read(EXPORT_CHUNK_BYTES):
+                    yield chunk
+            yield file_chunks
+        return
+    data = memoryview(storage.read(name))
+    # Copied out as bytes: StreamingResponse only passes bytes through unchanged.
+    yield lambda: (bytes(data[start:start + EXPORT_CHUNK_BYTES]) for start in range(0, len(data), EXPORT_CHUNK_BYTES))
+
+
+def _manifest_chunks(names: List[str]) -> Iterator[bytes]:
+    # Generated again for each pass rather than held in memory: it grows with the number of codes.
+    row = io.StringIO()
+    writer = csv.writer(row)
+    for fields in itertools.chain([("name", "url")], ((name, url_of(name)) for name in names)):
+        writer.writerow(fields)
+        if row.tell() >= EXPORT_CHUNK_BYTES:
+            yield row.getvalue().encode("utf-8")
+            row.seek(0)
+            row.truncate()
+    yield row.getvalue().encode("utf-8")
+
+
+def export_archive_chunks(storage: QRStorage, names: List[str]) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive of stored QR codes piece by piece, for a streaming response.
+
+    Images are copied in chunks into STORED entries (they are compressed already), so memory
+    use does not grow with the size of the export; only one central directory record per
+    entry is kept until the end. A manifest.csv mapping every file to its target URL comes
+    first; a code deleted while the export runs stays in the manifest but is left out of
+    the archive.
+    """
+    archive = _StoredZipWriter(time.localtime())
+    yield from archive.add(MANIFEST_NAME, lambda: _manifest_chunks(names))
+    exported = 0
+    for name in names:
+        try:
+            with _stored_image(storage, name) as chunks:
+                yield from archive.add(name, chunks)
+        except FileNotFoundError:
+            logger.warning("QR code %s was deleted during the export", name)
+            continue
+        exported += 1
+    yield archive.finish()
+    logger.info("Exported %d QR code(s)", exported)
@@ -0,0 +1,258 @@
+import re
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Supported output formats: name -> (media type, file extension).
+QR_FORMATS: Dict[str, Tuple[str, str]] = {
+    'png': ('image/png', '.png'),
+    'svg': ('image/svg+xml', '.svg'),
+    'pbm': ('image/x-portable-bitmap', '.pbm'),
+}
+
+_MEDIA_TYPE_FORMATS = {media_type: name for name, (media_type, _) in QR_FORMATS.items()}
+
+# Named colors accepted for QR_CODE_COLOR / QR_BACKGROUND_HUE besides '#rgb' and '#rrggbb': the
+# CSS color keywords (https://www.w3.org/TR/css-color-4/#named-colors) plus this service's 'offwhite'.
+NAMED_COLORS: Dict[str, Tuple[int, int, int]] = {
+    'aliceblue': (240, 248, 255),
+    'antiquewhite': (250, 235, 215),
+    'aqua': (0, 255, 255),
+    'aquamarine': (127, 255, 212),
+    'azure': (240, 255, 255),
+    'beige': (245, 245, 220),
+    'bisque': (255, 228, 196),
+    'black': (0, 0, 0),
+    'blanchedalmond': (255, 235, 205),
+    'blue': (0, 0, 255),
+    'blueviolet': (138, 43, 226),
+    'brown': (165, 42, 42),
+    'burlywood': (222, 184, 135),
+    'cadetblue': (95, 158, 160),
+    'chartreuse': (127, 255, 0),
+    'chocolate': (210, 105, 30),
+    'coral': (255, 127, 80),
+    'cornflowerblue': (100, 149, 237),
+    'cornsilk': (255, 248, 220),
+    'crimson': (220, 20, 60),
+    'cyan': (0, 255, 255),
+    'darkblue': (0, 0, 139),
+    'darkcyan': (0, 139, 139),
+    'darkgoldenrod': (184, 134, 11),
+    'darkgray': (169, 169, 169),
+    'darkgreen': (0, 100, 0),
+    'darkgrey': (169, 169, 169),
+    'darkkhaki': (189, 183, 107),
+    'darkmagenta': (139, 0, 139),
+    'darkolivegreen': (85, 107, 47),
+    'darkorange': (255, 140, 0),
+    'darkorchid': (153, 50, 204),
+    'darkred': (139, 0, 0),
+    'darksalmon': (233, 150, 122),
+    'darkseagreen': (143, 188, 143),
+    'darkslateblue': (72, 61, 139),
+    'darkslategray': (47, 79, 79),
+    'darkslategrey': (47, 79, 79),
+    'darkturquoise': (0, 206, 209),
+    'darkviolet': (148, 0, 211),
+    'deeppink': (255, 20, 147),
+    'deepskyblue': (0, 191, 255),
+    'dimgray': (105, 105, 105),
+    'dimgrey': (105, 105, 105),
+    'dodgerblue': (30, 144, 255),
+    'firebrick': (178, 34, 34),
+    'floralwhite': (255, 250, 240),
+    'forestgreen': (34, 139, 34),
+    'fuchsia': (255, 0, 255),
+    'gainsboro': (220, 220, 220),
+    'ghostwhite': (248, 248, 255),
+    'gold': (255, 215, 0),
+    'goldenrod': (218, 165, 32),
+    'gray': (128, 128, 128),
+    'green': (0, 128, 0),
+    'greenyellow': (173, 255, 47),
+    'grey': (128, 128, 128),
+    'honeydew': (240, 255, 240),
+    'hotpink': (255, 105, 180),
+    'indianred': (205, 92, 92),
+    'indigo': (75, 0, 130),
+    'ivory': (255, 255, 240),
+    'khaki': (240, 230, 140),
+    'lavender': (230, 230, 250),
+    'lavenderblush': (255, 240, 245),
+    'lawngreen': (124, 252, 0),
+    'lemonchiffon': (255, 250, 205),
+    'lightblue': (173, 216, 230),
+    'lightcoral': (240, 128, 128),
+    'lightcyan': (224, 255, 255),
+    'lightgoldenrodyellow': (250, 250, 210),
+    'lightgray': (211, 211, 211),
+    'lightgreen': (144, 238, 144),
+    'lightgrey': (211, 211, 211),
+    'lightpink': (255, 182, 193),
+    'lightsalmon': (255, 160, 122),
+    'lightseagreen': (32, 178, 170),
+    'lightskyblue': (135, 206, 250),
+    'lightslategray': (119, 136, 153),
+    'lightslategrey': (119, 136, 153),
+    'lightsteelblue': (176, 196, 222),
+    'lightyellow': (255, 255, 224),
+    'lime': (0, 255, 0),
+    'limegreen': (50, 205, 50),
+    'linen': (250, 240, 230),
+    'magenta': (255, 0, 255),
+    'maroon': (128, 0, 0),
+    'mediumaquamarine': (102, 205, 170),
+    'mediumblue': (0, 0, 205),
+    'mediumorchid': (186, 85, 211),
+    'mediumpurple': (147, 112, 219),
+    'mediumseagreen': (60, 179, 113),
+    'mediumslateblue': (123, 104, 238),
+    'mediumspringgreen': (0, 250, 154),
+    'mediumturquoise': (72, 209, 204),
+    'mediumvioletred': (199, 21, 133),
+    'midnightblue': (25, 25, 112),
+    'mintcream': (245, 255, 250),
+    'mistyrose': (255, 228, 225),
+    'moccasin': (255, 228, 181),
+    'navajowhite': (255, 222, 173),
+    'navy': (0, 0, 128),
+    'offwhite': (250, 249, 246),
+    'oldlace': (253, 245, 230),
+    'olive': (128, 128, 0),
+    'olivedrab': (107, 142, 35),
+    'orange': (255, 165, 0),
+    'orangered': (255, 69, 0),
+    'orchid': (218, 112, 214),
+    'palegoldenrod': (238, 232, 170),
+    'palegreen': (152, 251, 152),
+    'paleturquoise': (175, 238, 238),
+    'palevioletred': (219, 112, 147),
+    'papayawhip': (255, 239, 213),
+    'peachpuff': (255, 218, 185),
+    'peru': (205, 133, 63),
+    'pink': (255, 192, 203),
+    'plum': (221, 160, 221),
+    'powderblue': (176, 224, 230),
+    'purple': (128, 0, 128),
+    'rebeccapurple': (102, 51, 153),
+    'red': (255, 0, 0),
+    'rosybrown': (188, 143, 143),
+    'royalblue': (65, 105, 225),
+    'saddlebrown': (139, 69, 19),
+    'salmon': (250, 128, 114),
+    'sandybrown': (244, 164, 96),
+    'seagreen': (46, 139, 87),
+    'seashell': (255, 245, 238),
+    'sienna': (160, 82, 45),
+    'silver': (192, 192, 192),
+    'skyblue': (135, 206, 235),
+    'slateblue': (106, 90, 205),
+    'slategray': (112, 128, 144),
+    'slategrey': (112, 128, 144),
+    'snow': (255, 250, 250),
+    'springgreen': (0, 255, 127),
+    'steelblue': (70, 130, 180),
+    'tan': (210, 180, 140),
+    'teal': (0, 128, 128),
+    'thistle': (216, 191, 216),
+    'tomato': (255, 99, 71),
+    'turquoise': (64, 224, 208),
+    'violet': (238, 130, 238),
+    'wheat': (245, 222, 179),
+    'white': (255, 255, 255),
+    'whitesmoke': (245, 245, 245),
+    'yellow': (255, 255, 0),
+    'yellowgreen': (154, 205, 50),
+}
+
+_HEX_COLOR = re.compile(r'^#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$')
+
+
+def resolve_color(color: str) -> Tuple[int, int, int]:
+    """
+    Turn a color name or hex string into an RGB tuple.
+
+    Arguments:
+    - color (str): A name from NAMED_COLORS, '#rgb' or '#rrggbb'.
+
+    Returns:
+    - The (red, green, blue) tuple.
+    """
+    named = NAMED_COLORS.get(color.strip().lower())
+    if named is not None:
+        return named
+    match = _HEX_COLOR.match(color.strip())
+    if not match:
+        raise ValueError(f"Unsupported color: {color}")
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    return tuple(int(digits[index:index + 2], 16) for index in (0, 2, 4))
+
+
+def color_to_hex(color: str) -> str:
+    return '#%02x%02x%02x' % resolve_color(color)
+
+
+def negotiate_format(accept_header: Optional[str], requested: Optional[str] = None, default: str = 'png') -> str:
+    """
+    Pick the output format for a request.
+
+    An explicitly requested format wins. Otherwise the image type with the highest
+    quality value in the Accept header is used, falling back to `default` when the
+    header names no supported image type (e.g. 'application/json' or '*/*').
+    """
+    if requested:
+        return requested
+    best_format, best_quality = default, 0.0
+    for media_range in (accept_header or '').split(','):
+        media_type, *parameters = [part.strip() for part in media_range.split(';')]
+        fmt = _MEDIA_TYPE_FORMATS.get(media_type.lower())
+        if fmt is None:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best_format, best_quality = fmt, quality
+    return best_format
+
+
+def svg_chunks(matrix: Sequence[Sequence[bool]], box_size: int, qr_color: str, background: str) -> Iterator[str]:
+    """
+    Generate an SVG document for a QR module matrix, one row of path data at a time.
+
+    Horizontal runs of dark modules are merged into a single rectangle each, so the
+    path stays small. Coordinates are in modules; the width and height attributes
+    scale the drawing to `box_size` pixels per module.
+    """
+    import numpy as np  # Deferred, like in png_raster: only rendering needs it.
+    modules = np.asarray(matrix, dtype=bool)
+    size = modules.shape[1]
+    pixels = size * box_size
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="{color_to_hex(background)}"/>'
+        f'<path fill="{color_to_hex(qr_color)}" d="'
+    )
+    for y, row in enumerate(modules):
+        # Run boundaries are where the padded row changes value: starts at even positions, ends at odd.
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).astype(np.int8)))
+        if edges.size:
+            yield ''.join(f'M{start} {y}h{end - start}v1h-{end - start}z' for start, end in zip(edges[::2], edges[1::2]))
+    yield '"/></svg>\n'
+
+
+def encode_pbm(matrix: Sequence[Sequence[bool]], box_size: int) -> bytes:
+    """
+    Encode a QR module matrix as a raw (P4) 1-bit PBM image, where a set bit is a dark pixel.
+    """
+    import numpy as np
+    dark = np.asarray(matrix, dtype=bool)
+    rows = np.repeat(np.packbits(np.repeat(dark, box_size, axis=1), axis=1), box_size, axis=0)
+    return f'P4\n{dark.shape[1] * box_size} {dark.shape[0] * box_size}\n'.encode('ascii') + rows.tobytes()
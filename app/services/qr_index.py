@@ -0,0 +1,201 @@
+import binascii
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.services.qr_storage import QRStorage, qr_storage
+from app.utils.common import base64_to_url
+
+logger = logging.getLogger(__name__)
+
+
+class QRIndex:
+    """
+    Metadata index of stored QR codes, backed by SQLite in WAL mode.
+
+    Keeps one row per stored image so duplicate checks and listings are
+    primary-key lookups instead of filesystem scans. The index is created by
+    `open` (or on first use) and seeded from the images already present in
+    the storage backend. Every method does blocking I/O under a lock, so the
+    application calls them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, db_path: Path, storage: QRStorage):
+        self.db_path = db_path
+        self.storage = storage
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS qr_codes (
+                    name TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    primary_color TEXT,
+                    background_color TEXT,
+                    dimensions INTEGER,
+                    byte_length INTEGER,
+                    created_at REAL NOT NULL,
+                    expires_at REAL,
+                    etag TEXT
+                )
+                """
+            )
+            # Columns added after the first release; older index files gain them in place.
+            existing_columns = {column["name"] for column in connection.execute("PRAGMA table_info(qr_codes)")}
+            for column, column_type in (("expires_at", "REAL"), ("etag", "TEXT")):
+                if column not in existing_columns:
+                    connection.execute(f"ALTER TABLE qr_codes ADD COLUMN {column} {column_type}")
+            # Expiring codes only, in expiry order: the sweeper reads the front of this index.
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS qr_codes_by_expiry ON qr_codes (expires_at) WHERE expires_at IS NOT NULL"
+            )
+            self._connection = connection
+            if connection.execute("SELECT 1 FROM qr_codes LIMIT 1").fetchone() is None:
+                self._backfill(connection)
+        return self._connection
+
+    def open(self):
+        """
+        Create the index and seed it from storage if it is empty. Seeding lists and stats every
+        stored image, so the application does this once at start-up, off the event loop.
+        """
+        with self._lock:
+            self._connect()
+
+    def _backfill(self, connection: sqlite3.Connection):
+        """
+        Seed an empty index from the images already in storage.
+        """
+        try:
+            file_names = self.storage.names()
+        except FileNotFoundError:
+            return
+        rows = []
+        for file_name in file_names:
+            try:
+                url = base64_to_url(file_name.rsplit('.', 1)[0])
+            except (binascii.Error, UnicodeDecodeError):
+                # Not a name this service writes; leave the file alone rather than fail start-up.
+                logger.warning("Skipping %s while indexing: its name is not an encoded URL", file_name)
+                continue
+            byte_length, modified_at = self.storage.stat(file_name)
+            rows.append((file_name, url, byte_length, modified_at))
+        connection.executemany(
+            "INSERT OR IGNORE INTO qr_codes (name, url, byte_length, created_at) VALUES (?, ?, ?, ?)", rows
+        )
+        logger.info("Indexed %d existing QR codes from storage", len(rows))
+
+    def add(self, name: str, url: str, primary_color: str, background_color: str, dimensions: int, byte_length: int,
+            expires_at: Optional[float] = None, etag: Optional[str] = None):
+        """
+        Record a newly stored QR code, replacing any previous entry with the same name.
+        `expires_at` is a Unix timestamp after which the expiry sweeper deletes the code;
+        `etag` is the content-derived entity tag served with downloads.
+        """
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO qr_codes"
+                " (name, url, primary_color, background_color, dimensions, byte_length, created_at, expires_at, etag)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, url, primary_color, background_color, dimensions, byte_length, time.time(), expires_at, etag),
+            )
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM qr_codes WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def set_etag(self, name: str, etag: str):
+        # Fills in tags for entries indexed before they were recorded at creation time.
+        with self._lock:
+            self._connect().execute("UPDATE qr_codes SET etag = ? WHERE name = ?", (etag, name))
+
+    def remove(self, name: str) -> bool:
+        """
+        Drop a QR code from the index. Returns True if an entry was removed.
+        """
+        with self._lock:
+            return self._connect().execute("DELETE FROM qr_codes WHERE name = ?", (name,)).rowcount > 0
+
+    def remove_if_expired(self, name: str, now: float) -> bool:
+        """
+        Drop a QR code from the index only if it has expired by `now`. Returns True if it was removed.
+        """
+        with self._lock:
+            return self._connect().execute(
+                "DELETE FROM qr_codes WHERE name = ? AND expires_at <= ?", (name, now)
+            ).rowcount > 0
+
+    def expired(self, now: float, limit: int) -> List[str]:
+        """
+        Names of up to `limit` codes that expired by `now`, the longest expired first.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT name FROM qr_codes WHERE expires_at <= ? ORDER BY expires_at LIMIT ?", (now, limit)
+            ).fetchall()
+        return [row["name"] for row in rows]
+
+    def next_expiry(self) -> Optional[float]:
+        # The IS NOT NULL condition lets SQLite answer from the partial expiry index instead of scanning the table.
+        with self._lock:
+            return self._connect().execute("SELECT MIN(expires_at) FROM qr_codes WHERE expires_at IS NOT NULL").fetchone()[0]
+
+    def mark_expired(self, now: float, url_prefix: Optional[str] = None, created_before: Optional[float] = None) -> int:
+        """
+        Expire every code matching the filters as of `now`, leaving the deletion to the sweeper.
+
+        Arguments:
+        - url_prefix (str): Only codes whose target URL starts with this text.
+        - created_before (float): Only codes created before this Unix timestamp.
+
+        Returns:
+        - The number of codes marked.
+        """
+        conditions, parameters = ["(expires_at IS NULL OR expires_at > ?)"], [now]
+        if url_prefix is not None:
+            # Compared exactly: LIKE would be case-insensitive and treat % and _ in URLs as wildcards.
+            conditions.append("substr(url, 1, ?) = ?")
+            parameters.extend([len(url_prefix), url_prefix])
+        if created_before is not None:
+            conditions.append("created_at < ?")
+            parameters.append(created_before)
+        with self._lock:
+            return self._connect().execute(
+                f"UPDATE qr_codes SET expires_at = ? WHERE {' AND '.join(conditions)}", [now, *parameters]
+            ).rowcount
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return self._connect().execute("SELECT 1 FROM qr_codes WHERE name = ?", (name,)).fetchone() is not None
+
+    def page(self, limit: int, after: Optional[str] = None) -> List[Dict]:
+        """
+        Return up to `limit` entries ordered by name, starting after the `after` cursor.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT * FROM qr_codes WHERE name > ? ORDER BY name LIMIT ?", (after or "", limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Shared index for the configured storage backend.
+qr_index = QRIndex(settings.qr_index_path, qr_storage)
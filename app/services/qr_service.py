@@ -1,9 +1,27 @@
+import hashlib
+import io
 import os
-from typing import List
-import qrcode
+import time
+import uuid
+from bisect import bisect_left
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional
 import logging
+import aiofiles
+import aiofiles.os
 from pathlib import Path
-from app.config import SERVICE_ROOT_URL, FILE_SERVE_DIRECTORY
+from app.config import settings
+from app.services.png_raster import encode_png
+from app.services.qr_formats import QR_FORMATS, encode_pbm, resolve_color, svg_chunks
+from app.utils.metrics import registry, stage
+
+if TYPE_CHECKING:
+    import qrcode
+
+logger = logging.getLogger(__name__)
+
+# File extensions of every supported output format, e.g. ('.png', '.svg', '.pbm').
+QR_FILE_EXTENSIONS = tuple(extension for _, extension in QR_FORMATS.values())
 
 def retrieve_qr_file_names(qr_folder: Path) -> List[str]:
     """
@@ -16,51 +34,321 @@ def retrieve_qr_file_names(qr_folder: Path) -> List[str]:
     - A list containing the file names of all QR codes within the directory.
     """
     try:
-        # Fetch all '.png' files located in the given directory.
-        return [filename for filename in os.listdir(qr_folder) if filename.endswith('.png')]
+        # Fetch all image files of a supported format located in the given directory.
+        return [filename for filename in os.listdir(qr_folder) if filename.endswith(QR_FILE_EXTENSIONS)]
     except FileNotFoundError:
-        logging.error(f"Could not find the directory: {qr_folder}")
+        logger.error("Could not find the directory: %s", qr_folder)
         raise
     except OSError as error:
-        logging.error(f"OS error encountered during QR retrieval: {error}")
+        logger.error("OS error encountered during QR retrieval: %s", error)
         raise
 
-def create_qr_image(content: str, destination: Path, qr_color: str = 'red', background: str = 'white', module_size: int = 10):
+# qrcode's error-correction constants (qrcode.constants.ERROR_CORRECT_*), keyed by the level names
+# used in requests. Spelled out so that importing this module does not load qrcode.
+ERROR_CORRECTION_LEVELS = {
+    'L': 1,
+    'M': 0,
+    'Q': 3,
+    'H': 2,
+}
+
+@lru_cache(maxsize=None)
+def _byte_mode_capacities(error_correction: str) -> List[int]:
+    """
+    Maximum number of byte-mode data bytes that fit in each version 1-40 at the given error-correction level.
+
+    Computed once per process and level, the first time fast mode needs it.
+    """
+    import qrcode.util
+    level = ERROR_CORRECTION_LEVELS[error_correction]
+    capacities = []
+    for version in range(1, 41):
+        header_bits = 4 + qrcode.util.length_in_bits(qrcode.util.MODE_8BIT_BYTE, version)
+        capacities.append((qrcode.util.BIT_LIMIT_TABLE[level][version] - header_bits) // 8)
+    return capacities
+
+def pick_version(byte_length: int, error_correction: str = 'M') -> int:
+    """
+    Smallest QR version that holds `byte_length` bytes of byte-mode data.
+    
+    Arguments:
+    - byte_length (int): Length of the encoded data in bytes.
+    - error_correction (str): One of 'L', 'M', 'Q' or 'H'.
+    
+    Returns:
+    - The QR version, between 1 and 40.
+    """
+    version = bisect_left(_byte_mode_capacities(error_correction), byte_length) + 1
+    if version > 40:
+        import qrcode.exceptions
+        raise qrcode.exceptions.DataOverflowError()
+    return version
+
+def _encode_qr(content: str, module_size: int, error_correction: str, fast_encode: bool) -> 'qrcode.QRCode':
+    with stage("encode"):
+        return _encode_qr_unmeasured(content, module_size, error_correction, fast_encode)
+
+def _encode_qr_unmeasured(content: str, module_size: int, error_correction: str, fast_encode: bool) -> 'qrcode.QRCode':
+    import qrcode  # Deferred so that workers and the web process only load qrcode when they first render.
+    if fast_encode:
+        data = content.encode('utf-8')
+        qr_instance = qrcode.QRCode(
+            version=pick_version(len(data), error_correction),
+            error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+            box_size=module_size,
+            border=5,
+            mask_pattern=settings.qr_fast_mask_pattern,
+        )
+        # A single byte-mode segment, so the data is guaranteed to fit the version picked above.
+        qr_instance.add_data(data, optimize=0)
+        qr_instance.make(fit=False)
+    else:
+        qr_instance = qrcode.QRCode(version=1, error_correction=ERROR_CORRECTION_LEVELS[error_correction], box_size=module_size, border=5)
+        qr_instance.add_data(content)
+        qr_instance.make(fit=True)
+    return qr_instance
+
+def build_qr_matrix(content: str, error_correction: str = 'M', fast_encode: bool = False) -> List[List[bool]]:
     """
-    Craft a QR code image from the supplied content and store it at the specified location.
+    Encode the supplied content and return its module matrix, border included.
+    
+    Arguments:
+    - content (str): Data to be encoded in the QR code.
+    - error_correction (str): Error-correction level, one of 'L', 'M', 'Q' or 'H'.
+    - fast_encode (bool): Skip version probing and mask scoring (see QR_FAST_ENCODE).
+    
+    Returns:
+    - Rows of booleans, True for dark modules.
+    """
+    return _encode_qr(content, 1, error_correction, fast_encode).get_matrix()
+
+def render_qr_png(content: str, qr_color: str = 'red', background: str = 'white', module_size: int = 10,
+                  error_correction: str = 'M', fast_encode: bool = False) -> bytes:
+    """
+    Render a QR code for the supplied content and return the encoded PNG bytes.
+    
+    Arguments:
+    - content (str): Data to be encoded in the QR code.
+    - qr_color (str): Color for the QR code content.
+    - background (str): Background color for the QR code.
+    - module_size (int): Dimension of each square in the QR code grid.
+    - error_correction (str): Error-correction level, one of 'L', 'M', 'Q' or 'H'.
+    - fast_encode (bool): Skip version probing and mask scoring (see QR_FAST_ENCODE).
+    
+    Returns:
+    - The PNG image as bytes: a 2-color palette PNG, dark color first.
+    """
+    qr_instance = _encode_qr(content, module_size, error_correction, fast_encode)
+    with stage("rasterize"):
+        matrix = qr_instance.get_matrix()
+        palette = (resolve_color(qr_color), resolve_color(background))
+        if settings.qr_fast_raster:
+            return encode_png(matrix, module_size, palette=palette, compress_level=settings.qr_png_compression)
+        # Reference path: PyPNG writes the same palette image, expanding the rows in pure Python.
+        import png
+        size = len(matrix) * module_size
+        rows = ([int(not dark) for dark in row for _ in range(module_size)] for row in matrix for _ in range(module_size))
+        buffer = io.BytesIO()
+        png.Writer(size, size, palette=palette, bitdepth=1, compression=settings.qr_png_compression).write(buffer, rows)
+        return buffer.getvalue()
+
+def render_qr_image(content: str, qr_color: str = 'red', background: str = 'white', module_size: int = 10,
+                    error_correction: str = 'M', fast_encode: bool = False, output_format: str = 'png') -> bytes:
+    """
+    Render a QR code for the supplied content in the requested output format.
     
     Arguments:
     - content (str): Data to be encoded in the QR code.
-    - destination (Path): File path where the QR code image will be saved.
     - qr_color (str): Color for the QR code content.
     - background (str): Background color for the QR code.
     - module_size (int): Dimension of each square in the QR code grid.
+    - error_correction (str): Error-correction level, one of 'L', 'M', 'Q' or 'H'.
+    - fast_encode (bool): Skip version probing and mask scoring (see QR_FAST_ENCODE).
+    - output_format (str): One of the keys of QR_FORMATS.
+    
+    Returns:
+    - The encoded image as bytes.
+    """
+    if output_format == 'png':
+        return render_qr_png(content, qr_color, background, module_size, error_correction, fast_encode)
+    matrix = build_qr_matrix(content, error_correction, fast_encode)
+    with stage("rasterize"):
+        if output_format == 'svg':
+            return ''.join(svg_chunks(matrix, module_size, qr_color, background)).encode('utf-8')
+        if output_format == 'pbm':
+            return encode_pbm(matrix, module_size)
+    raise ValueError(f"Unsupported QR output format: {output_format}")
+
+def content_etag(image_bytes: bytes) -> str:
     """
-    logging.debug("Initiating QR code creation")
+    Strong entity tag for an image, derived from its bytes so every worker computes the same tag.
+    """
+    return '"%s"' % hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+def download_url(qr_img_name: str, etag: Optional[str] = None) -> str:
+    """
+    Public link to a stored image. Given the image's etag, the link names that version (?v=),
+    so it changes whenever the image stored under the name does.
+    """
+    url = f"{settings.service_root_url}/{settings.file_serve_directory}/{qr_img_name}"
+    if etag is None:
+        return url
+    version = etag.strip('"')
+    return f"{url}?v={version}"
+
+def _temporary_path(destination: Path) -> Path:
+    # Hidden, uniquely named sibling: same filesystem for os.replace, and ignored by listings.
+    return destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.tmp")
+
+def _fsync_directory(directory: Path):
+    directory_fd = os.open(directory, os.O_RDONLY)
     try:
-        qr_instance = qrcode.QRCode(version=1, box_size=module_size, border=5)
-        qr_instance.add_data(content)
-        qr_instance.make(fit=True)
-        qr_img = qr_instance.make_image(fill_color=qr_color, back_color=background)
-        qr_img.save(str(destination))
-        logging.info(f"Stored QR code at {destination}")
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+# Thread-offloaded variants used by the async storage path.
+_async_fsync = aiofiles.os.wrap(os.fsync)
+_async_fsync_directory = aiofiles.os.wrap(_fsync_directory)
+
+async def store_qr_image(image_bytes: bytes, destination: Path):
+    """
+    Asynchronously and atomically store rendered QR code bytes at the specified location.
+    
+    The image is written to a temporary file in the destination directory, optionally
+    fsynced (QR_STORAGE_FSYNC) and then renamed into place, so readers such as nginx
+    never see a partially written image.
+    
+    Arguments:
+    - image_bytes (bytes): The encoded image.
+    - destination (Path): File path where the QR code image will be saved.
+    """
+    temp_path = _temporary_path(destination)
+    try:
+        with stage("save"):
+            async with aiofiles.open(temp_path, 'wb') as temp_file:
+                await temp_file.write(image_bytes)
+                if settings.qr_storage_fsync:
+                    await temp_file.flush()
+                    await _async_fsync(temp_file.fileno())
+            await aiofiles.os.replace(temp_path, destination)
+            if settings.qr_storage_fsync:
+                await _async_fsync_directory(destination.parent)
     except Exception as error:
-        logging.error(f"QR code creation/storage failed: {error}")
+        logger.error("QR code storage failed: %s", error)
+        try:
+            await aiofiles.os.remove(temp_path)
+        except FileNotFoundError:
+            pass
         raise
+    registry.inc("qr_storage_bytes_written_total", len(image_bytes))
+    logger.info("Stored QR code at %s", destination)
 
-def remove_qr_image(qr_file: Path):
+async def remove_qr_image(qr_file: Path):
     """
-    Erase a QR code image file from the given path.
+    Erase a QR code image file from the given path without blocking the event loop.
     
     Arguments:
     - qr_file (Path): Path to the QR code image file to be removed.
     """
-    if qr_file.is_file():
-        qr_file.unlink()  # Perform the file deletion
-        logging.info(f"Deleted QR code file {qr_file.name} successfully")
-    else:
-        logging.error(f"QR code file {qr_file.name} could not be located for removal")
+    try:
+        await aiofiles.os.remove(qr_file)  # Perform the file deletion
+    except FileNotFoundError:
+        logger.error("QR code file %s could not be located for removal", qr_file.name)
         raise FileNotFoundError(f"QR code file {qr_file.name} could not be located")
+    logger.info("Deleted QR code file %s successfully", qr_file.name)
+
+# Counts of cross-process claims that were lost to another worker or taken over after going stale.
+claim_stats = {"claims_lost": 0, "stale_claims_broken": 0}
+
+def _claim_path(destination: Path) -> Path:
+    return destination.with_name(f".{destination.name}.lock")
+
+def _claim_is_stale(claim_path: Path) -> bool:
+    return time.time() - claim_path.stat().st_mtime >= settings.qr_claim_stale_seconds
+
+def _try_claim(destination: Path) -> Optional[Path]:
+    claim_path = _claim_path(destination)
+    for _ in range(2):
+        try:
+            os.close(os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return claim_path
+        except FileExistsError:
+            try:
+                if not _claim_is_stale(claim_path):
+                    break
+            except FileNotFoundError:
+                continue  # Released between our attempt and the stat; try again.
+        # Move the stale claim aside under a name of our own: of several processes doing this
+        # at once only one rename succeeds, so a claim is never removed by two of them.
+        set_aside = claim_path.with_name(f"{claim_path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(claim_path, set_aside)
+        except FileNotFoundError:
+            continue  # Released or set aside by another process; compete for the new claim.
+        if not _claim_is_stale(set_aside):
+            # Another process took the stale claim over after we looked at it: give its claim back.
+            try:
+                os.link(set_aside, claim_path)
+            except FileExistsError:
+                pass
+            set_aside.unlink(missing_ok=True)
+            break
+        set_aside.unlink(missing_ok=True)
+        claim_stats["stale_claims_broken"] += 1
+        logger.warning("Took over stale render claim for %s", destination.name)
+    claim_stats["claims_lost"] += 1
+    return None
+
+async def claim_qr_name(destination: Path) -> Optional[Path]:
+    """
+    Claim the right to render a QR code across worker processes.
+    
+    The claim is an exclusively created (O_EXCL) lock file next to the destination.
+    Claims older than QR_CLAIM_STALE_SECONDS are treated as abandoned: they are renamed
+    aside, which only one contender can do, and the claim is then created afresh.
+    
+    Arguments:
+    - destination (Path): File path the QR code image will be saved to.
+    
+    Returns:
+    - The claim's path, to pass to release_qr_claim, or None if another process holds it.
+    """
+    return await _async_try_claim(destination)
+
+async def release_qr_claim(claim_path: Path):
+    """
+    Release a claim obtained from claim_qr_name.
+    """
+    try:
+        await aiofiles.os.remove(claim_path)
+    except FileNotFoundError:
+        logger.warning("Render claim %s was already released", claim_path.name)
+
+_async_try_claim = aiofiles.os.wrap(_try_claim)
+
+def discard_partial_writes(qr_folder: Path):
+    """
+    Delete temporary files left behind by writes that were interrupted, e.g. by a crash, and
+    render claims that went stale because their process died.
+    
+    Arguments:
+    - qr_folder (Path): Path to the directory that holds QR code files.
+    """
+    for filename in os.listdir(qr_folder):
+        if not filename.startswith('.'):
+            continue
+        if filename.endswith('.tmp'):
+            (qr_folder / filename).unlink(missing_ok=True)
+            logger.warning("Discarded partially written QR code file %s", filename)
+        elif filename.endswith('.stale') or (filename.endswith('.lock') and filename[1:-len('.lock')].endswith(QR_FILE_EXTENSIONS)):
+            # Claims still fresh may belong to another worker that is running.
+            try:
+                if filename.endswith('.stale') or _claim_is_stale(qr_folder / filename):
+                    (qr_folder / filename).unlink(missing_ok=True)
+                    logger.warning("Discarded stale render claim %s", filename)
+            except FileNotFoundError:
+                pass
 
 def establish_directory_if_missing(dir_path: Path):
     """
@@ -69,14 +357,14 @@ def establish_directory_if_missing(dir_path: Path):
     Arguments:
     - dir_path (Path): Path where the directory is to be established.
     """
-    logging.debug('Attempting directory creation')
+    logger.debug('Attempting directory creation')
     try:
         dir_path.mkdir(parents=True, exist_ok=True)  # Make the directory, along with any parents if necessary
     except FileExistsError:
-        logging.info(f"The directory already exists: {dir_path}")
+        logger.info("The directory already exists: %s", dir_path)
     except PermissionError as error:
-        logging.error(f"Denied permission to create directory at {dir_path}: {error}")
+        logger.error("Denied permission to create directory at %s: %s", dir_path, error)
         raise
     except Exception as error:
-        logging.error(f"An unexpected error occurred while creating directory at {dir_path}: {error}")
+        logger.error("An unexpected error occurred while creating directory at %s: %s", dir_path, error)
         raise
@@ -0,0 +1,121 @@
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+from app.services.qr_service import (discard_partial_writes, establish_directory_if_missing, remove_qr_image,
+                                     retrieve_qr_file_names, store_qr_image)
+
+logger = logging.getLogger(__name__)
+
+
+class QRStorage:
+    """
+    Where rendered QR images live, addressed by their file name (e.g. '<base64 url>.png').
+
+    Backends implement every method below. `delete`, `read` and `stat` raise
+    FileNotFoundError for unknown names.
+    """
+    # Directory the backend keeps its files in.
+    root: Path
+
+    def open(self):
+        """
+        Prepare the backend for use, recovering from an unclean shutdown if needed.
+        """
+        raise NotImplementedError
+
+    async def put(self, name: str, image_bytes: bytes):
+        raise NotImplementedError
+
+    async def delete(self, name: str):
+        raise NotImplementedError
+
+    def read(self, name: str) -> Union[bytes, memoryview]:
+        raise NotImplementedError
+
+    def stat(self, name: str) -> Tuple[int, float]:
+        """
+        Returns the stored size in bytes and the modification time of an image.
+        """
+        raise NotImplementedError
+
+    def names(self) -> List[str]:
+        raise NotImplementedError
+
+    def path(self, name: str) -> Optional[Path]:
+        """
+        The file holding exactly this image, when the backend keeps one, so it can be sent with sendfile.
+        """
+        return None
+
+    def claim_target(self, name: str) -> Path:
+        """
+        The path cross-process claims on `name` are taken for (see `claim_qr_name`), so every
+        worker using this storage claims the same lock file.
+        """
+        return self.root / name
+
+    def stats(self) -> Dict[str, float]:
+        return {}
+
+    async def maintain(self):
+        """
+        Background upkeep run for the lifetime of the application; returns at once when there is none.
+        """
+
+    def close(self):
+        pass
+
+
+class DirectoryStorage(QRStorage):
+    """
+    One file per QR image in a directory, which nginx can serve directly (see QR_DOWNLOAD_ACCEL_PREFIX).
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def open(self):
+        establish_directory_if_missing(self.root)
+        # Removes temporary files from writes interrupted by a crash, so they never linger next to real images.
+        discard_partial_writes(self.root)
+
+    async def put(self, name: str, image_bytes: bytes):
+        await store_qr_image(image_bytes, self.root / name)
+
+    async def delete(self, name: str):
+        await remove_qr_image(self.root / name)
+
+    def read(self, name: str) -> bytes:
+        return (self.root / name).read_bytes()
+
+    def stat(self, name: str) -> Tuple[int, float]:
+        file_stat = (self.root / name).stat()
+        return file_stat.st_size, file_stat.st_mtime
+
+    def names(self) -> List[str]:
+        return retrieve_qr_file_names(self.root)
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+
+def open_storage(backend: str, root: Path) -> QRStorage:
+    """
+    Build the storage backend named by QR_STORAGE_BACKEND.
+
+    Arguments:
+    - backend (str): 'directory' or 'segments'.
+    - root (Path): The storage directory; the segment backend keeps its segment files there.
+    """
+    if backend == 'directory':
+        return DirectoryStorage(root)
+    if backend == 'segments':
+        from app.services.segment_store import SegmentStorage
+        return SegmentStorage(root, int(settings.qr_segment_max_mb * 1024 * 1024), settings.qr_compaction_ratio, settings.qr_compaction_interval_seconds)
+    raise ValueError(f"Unknown QR storage backend: {backend}")
+
+
+# Storage used by the routers, selected with QR_STORAGE_BACKEND.
+qr_storage = open_storage(settings.qr_storage_backend, settings.qr_storage_path)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from app.config import settings
+from app.utils.metrics import record_stages, run_instrumented, stage
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_worker():
+    """
+    Initializer for every render worker process.
+
+    Imports the QR rendering stack once so that the first job handled by a
+    worker does not pay for loading qrcode and its image backends.
+    """
+    import qrcode  # noqa: F401
+    import qrcode.image.pure  # noqa: F401
+
+
+def _worker_pid() -> int:
+    """Trivial job used to force worker processes to start."""
+    return os.getpid()
+
+
+class RenderEngine:
+    """
+    Runs CPU-bound QR rendering jobs outside the event loop.
+
+    Jobs are executed on a process pool so encoding, mask scoring and image
+    writing never block request handling. The number of jobs in flight is
+    bounded by the worker count plus the configured queue depth; callers past
+    that bound wait before their job is submitted.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+
+    def start(self):
+        """
+        Create the underlying executor if it is not running yet.
+        """
+        if self._executor is not None:
+            return
+        if self.workers > 0:
+            # 'spawn' keeps workers safe from locks held by threads in the parent at fork time.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qr-render")
+        logger.info("Render engine started with %d worker process(es)", self.workers)
+
+    async def warm_up(self):
+        """
+        Start every worker up front so the first requests do not pay for process start-up.
+        """
+        self.start()
+        await asyncio.gather(*(self.run(_worker_pid) for _ in range(max(self.workers, 1))))
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Execute `func(*args)` on the render pool and wait for its result.
+
+        Arguments:
+        - func (Callable): A module-level function, so it can be sent to worker processes.
+        - args: Positional arguments passed to the function.
+
+        Returns:
+        - Whatever the function returns.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        if self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(max(self.workers, 1) + self.queue_depth)
+            self._slots_loop = loop
+        self.in_flight += 1
+        try:
+            with stage("render_pool"):
+                async with self._slots:
+                    result, timings = await loop.run_in_executor(self._executor, partial(run_instrumented, func, *args))
+        except BrokenProcessPool:
+            logger.error("Render worker died unexpectedly, restarting the render pool")
+            self.shutdown()
+            raise
+        finally:
+            self.in_flight -= 1
+        # Stages timed inside the worker are recorded here, in the process serving /metrics.
+        record_stages(timings)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "queue_depth": self.queue_depth, "in_flight": self.in_flight}
+
+    def shutdown(self):
+        """
+        Stop the executor and release its workers.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Shared engine used by the routers and started by the application lifespan.
+render_engine = RenderEngine(settings.render_workers, settings.render_queue_depth)
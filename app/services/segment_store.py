@@ -0,0 +1,309 @@
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.qr_service import discard_partial_writes
+from app.services.qr_storage import QRStorage
+from app.utils.metrics import registry, stage
+
+logger = logging.getLogger(__name__)
+
+# Record header: kind, name length, data length, CRC32 of name + data. Name and data follow.
+_HEADER = struct.Struct(">BHII")
+_PUT = 1
+_TOMBSTONE = 2
+_SEGMENT_SUFFIX = ".seg"
+
+
+class SegmentStorage(QRStorage):
+    """
+    Packs QR images into large append-only segment files instead of one file each.
+    Only one process may open a storage directory (see QR_STORAGE_BACKEND).
+
+    Every write appends a record to the active segment; a delete appends a tombstone.
+    An in-memory offset index maps each name to (segment, offset, length) and is
+    rebuilt on start-up by replaying the segments in order, reading record headers
+    only. A record torn by a crash fails its CRC and is cut off the end of the
+    segment. Reads are zero-copy slices of a read-only mmap of the segment.
+
+    Once a segment is full a new one is started. Sealed segments whose share of
+    dead bytes (overwritten or deleted records) reaches `compaction_ratio` are
+    compacted in the background: their live records are copied to the active
+    segment and the file is removed. A tombstone is only carried over while an
+    older segment still holds a put for its name, since that put is all it hides.
+    Readers still holding a slice of a removed segment keep its mapping alive
+    until they drop it.
+    """
+
+    def __init__(self, root: Path, segment_max_bytes: int, compaction_ratio: float = 0.5, compaction_interval: float = 300):
+        self.root = root
+        self.segment_max_bytes = segment_max_bytes
+        self.compaction_ratio = compaction_ratio
+        self.compaction_interval = compaction_interval
+        self._index: Dict[str, Tuple[int, int, int]] = {}
+        self._sizes: Dict[int, int] = {}
+        self._dead: Dict[int, int] = {}
+        self._maps: Dict[int, mmap.mmap] = {}
+        # Names with a put record (live or dead) in each segment; decides which tombstones compaction keeps.
+        self._puts: Dict[int, Set[str]] = {}
+        self._active_id = 0
+        self._active_fd: Optional[int] = None
+        # Whether the active segment holds records appended without an fsync (see `_append`).
+        self._unsynced = False
+        self._owner_fd: Optional[int] = None
+        self._lock = threading.RLock()
+        self.compactions = 0
+
+    def _segment_path(self, segment_id: int) -> Path:
+        return self.root / f"{segment_id:08d}{_SEGMENT_SUFFIX}"
+
+    def open(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._owner_fd = os.open(self.root / ".segments.lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(self._owner_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._owner_fd)
+            self._owner_fd = None
+            raise RuntimeError(f"Segment storage in {self.root} is already open in another process; the segment backend "
+                               "supports a single server process (WEB_CONCURRENCY=1)")
+        # Render claims are taken in this directory too (see QRStorage.claim_target).
+        discard_partial_writes(self.root)
+        with self._lock:
+            segment_ids = sorted(int(path.stem) for path in self.root.glob(f"*{_SEGMENT_SUFFIX}") if path.stem.isdigit())
+            for segment_id in segment_ids:
+                self._replay(segment_id, verify=segment_id == segment_ids[-1])
+            self._open_active(segment_ids[-1] if segment_ids else 1)
+        logger.info("Opened %d segment(s) holding %d QR codes in %s", len(self._sizes), len(self._index), self.root)
+
+    def _replay(self, segment_id: int, verify: bool):
+        """
+        Apply one segment's records to the index. Only the newest segment can hold a torn
+        record, so only its payloads are checked against their CRC.
+        """
+        path = self._segment_path(segment_id)
+        size = path.stat().st_size
+        self._sizes[segment_id] = size
+        self._dead.setdefault(segment_id, 0)
+        self._puts.setdefault(segment_id, set())
+        if size == 0:
+            return
+        with open(path, "rb") as segment:
+            data = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        while offset + _HEADER.size <= size:
+            kind, name_length, data_length, checksum = _HEADER.unpack_from(data, offset)
+            end = offset + _HEADER.size + name_length + data_length
+            if kind not in (_PUT, _TOMBSTONE) or end > size or (verify and zlib.crc32(data[offset + _HEADER.size:end]) != checksum):
+                break
+            name = bytes(data[offset + _HEADER.size:offset + _HEADER.size + name_length]).decode("utf-8")
+            self._forget(name)
+            if kind == _PUT:
+                self._index[name] = (segment_id, end - data_length, data_length)
+                self._puts[segment_id].add(name)
+            else:
+                self._dead[segment_id] += end - offset
+            offset = end
+        self._maps[segment_id] = data
+        if offset < size:
+            logger.warning("Truncating %d byte(s) of incomplete records from %s", size - offset, path.name)
+            os.truncate(path, offset)
+            self._sizes[segment_id] = offset
+
+    def _forget(self, name: str):
+        # Marks the current record for `name`, if any, as dead space in its segment.
+        location = self._index.pop(name, None)
+        if location is not None:
+            segment_id, _, data_length = location
+            self._dead[segment_id] += _HEADER.size + len(name.encode("utf-8")) + data_length
+
+    def _open_active(self, segment_id: int):
+        if self._active_fd is not None:
+            if self._unsynced:
+                self._sync()
+            os.close(self._active_fd)
+        self._active_id = segment_id
+        self._active_fd = os.open(self._segment_path(segment_id), os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o644)
+        self._sizes.setdefault(segment_id, 0)
+        self._dead.setdefault(segment_id, 0)
+        self._puts.setdefault(segment_id, set())
+
+    def _append(self, kind: int, name: str, image_bytes: bytes = b"", sync: bool = True) -> Tuple[int, int]:
+        """
+        Append one record to the active segment, rolling over to a new segment when it is full.
+        With `sync` off the record is not fsynced here but by the next `_sync`, or when the
+        segment is rolled over.
+
+        Returns:
+        - The segment id and the offset of the record's data.
+        """
+        encoded_name = name.encode("utf-8")
+        body = encoded_name + image_bytes
+        record = _HEADER.pack(kind, len(encoded_name), len(image_bytes), zlib.crc32(body)) + body
+        if self._sizes[self._active_id] and self._sizes[self._active_id] + len(record) > self.segment_max_bytes:
+            self._open_active(self._active_id + 1)
+        offset = self._sizes[self._active_id]
+        try:
+            os.write(self._active_fd, record)
+            if sync:
+                self._sync()
+            else:
+                self._unsynced = True
+        except OSError:
+            # E.g. a full disk: drop whatever part of the record made it out so the next append lines up.
+            os.ftruncate(self._active_fd, offset)
+            raise
+        self._sizes[self._active_id] = offset + len(record)
+        return self._active_id, offset + _HEADER.size + len(encoded_name)
+
+    def _sync(self):
+        # Makes every record appended to the active segment so far durable.
+        if settings.qr_storage_fsync:
+            os.fsync(self._active_fd)
+        self._unsynced = False
+
+    def _put(self, name: str, image_bytes: bytes, sync: bool = True):
+        with self._lock:
+            segment_id, data_offset = self._append(_PUT, name, image_bytes, sync)
+            self._forget(name)
+            self._index[name] = (segment_id, data_offset, len(image_bytes))
+            self._puts[segment_id].add(name)
+
+    def _delete(self, name: str):
+        with self._lock:
+            if name not in self._index:
+                raise FileNotFoundError(f"QR code file {name} could not be located")
+            segment_id, _ = self._append(_TOMBSTONE, name)
+            self._forget(name)
+            self._dead[segment_id] += _HEADER.size + len(name.encode("utf-8"))
+
+    async def put(self, name: str, image_bytes: bytes):
+        with stage("save"):
+            await asyncio.to_thread(self._put, name, image_bytes)
+        registry.inc("qr_storage_bytes_written_total", len(image_bytes))
+        logger.info("Stored QR code %s in segment %d", name, self._active_id)
+
+    async def delete(self, name: str):
+        await asyncio.to_thread(self._delete, name)
+        logger.info("Deleted QR code %s", name)
+
+    def read(self, name: str) -> memoryview:
+        with self._lock:
+            location = self._index.get(name)
+            if location is None:
+                raise FileNotFoundError(f"QR code file {name} could not be located")
+            segment_id, data_offset, data_length = location
+            data = self._maps.get(segment_id)
+            if data is None or len(data) < data_offset + data_length:
+                # The active segment grew since it was last mapped; the old mapping stays valid for existing slices.
+                with open(self._segment_path(segment_id), "rb") as segment:
+                    data = self._maps[segment_id] = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(data)[data_offset:data_offset + data_length]
+
+    def stat(self, name: str) -> Tuple[int, float]:
+        with self._lock:
+            location = self._index.get(name)
+            if location is None:
+                raise FileNotFoundError(f"QR code file {name} could not be located")
+            return location[2], self._segment_path(location[0]).stat().st_mtime
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._index)
+
+    def compact(self) -> int:
+        """
+        Rewrite every sealed segment whose dead share reached the compaction ratio.
+
+        Returns:
+        - The number of segments removed.
+        """
+        with self._lock:
+            candidates = [segment_id for segment_id, size in self._sizes.items()
+                          if segment_id != self._active_id and size and self._dead[segment_id] / size >= self.compaction_ratio]
+        for segment_id in sorted(candidates):
+            self._compact_segment(segment_id)
+        return len(candidates)
+
+    def _compact_segment(self, segment_id: int):
+        path = self._segment_path(segment_id)
+        with self._lock:
+            data = self._maps.get(segment_id)
+            size = self._sizes[segment_id]
+            if data is None or len(data) < size:
+                # Not mapped yet, or mapped while it was still the active segment and shorter.
+                with open(path, "rb") as segment:
+                    data = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        while offset < size:
+            kind, name_length, data_length, _ = _HEADER.unpack_from(data, offset)
+            name_start = offset + _HEADER.size
+            end = name_start + name_length + data_length
+            name = bytes(data[name_start:name_start + name_length]).decode("utf-8")
+            # Each record is moved under the lock, so writers interleave with a long compaction.
+            with self._lock:
+                if kind == _PUT and self._index.get(name) == (segment_id, end - data_length, data_length):
+                    self._put(name, bytes(data[end - data_length:end]), sync=False)
+                elif kind == _TOMBSTONE and name not in self._index and self._put_before(name, segment_id):
+                    # Still shadows a put in an older segment; without it the code would come back on restart.
+                    moved_to, _ = self._append(_TOMBSTONE, name, sync=False)
+                    self._dead[moved_to] += end - offset
+            offset = end
+        with self._lock:
+            # One fsync for every moved record, before the only other copy is removed.
+            if self._unsynced:
+                self._sync()
+            del self._sizes[segment_id]
+            del self._dead[segment_id]
+            del self._puts[segment_id]
+            # Not closed: slices handed out by read() may still refer to it. It is unmapped once they are gone.
+            self._maps.pop(segment_id, None)
+            path.unlink()
+        self.compactions += 1
+        logger.info("Compacted segment %s", path.name)
+
+    def _put_before(self, name: str, segment_id: int) -> bool:
+        return any(name in names for other, names in self._puts.items() if other < segment_id)
+
+    async def maintain(self):
+        while True:
+            await asyncio.sleep(self.compaction_interval)
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception:
+                logger.exception("Segment compaction failed")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "segments": len(self._sizes),
+                "records": len(self._index),
+                "bytes": sum(self._sizes.values()),
+                "dead_bytes": sum(self._dead.values()),
+                "compactions": self.compactions,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._active_fd is not None:
+                if self._unsynced:
+                    self._sync()
+                os.close(self._active_fd)
+                self._active_fd = None
+            for data in self._maps.values():
+                try:
+                    data.close()
+                except BufferError:
+                    pass  # A reader still holds a slice; the mapping goes away with it.
+            self._maps.clear()
+            if self._owner_fd is not None:
+                os.close(self._owner_fd)
+                self._owner_fd = None
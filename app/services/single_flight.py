@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it is still running wait for the leader's outcome instead of
+    repeating the work. Counters record how often work was shared.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `work()` unless a call for `key` is already in flight.
+
+        Arguments:
+        - key (Hashable): Identifies equivalent work.
+        - work (Callable): Coroutine function performing the work.
+
+        Returns:
+        - A tuple of the result and whether it was shared from another caller's execution.
+          Exceptions raised by the leader are raised in every waiting caller.
+        """
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            # Shielded so a follower giving up does not cancel the leader's work.
+            return await asyncio.shield(pending), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.leaders += 1
+        try:
+            result = await work()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # Mark as retrieved when no follower is waiting.
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -2,45 +2,67 @@ import logging.config
 import os
 import base64
 from typing import Dict, List
-from dotenv import load_dotenv
-from jose import jwt
 from datetime import datetime, timedelta, timezone
-import validators
 from urllib.parse import urlparse, urlunparse
-from app.config import ADMIN_PASSWORD, ADMIN_USER, ALGORITHM, SECRET_KEY
+from app.config import settings
+from app.utils.log_pipeline import LogVolumeFilter, install_queue_logging
+from app.utils.metrics import stage
 
-# Load environment configurations for secure and configurable operations.
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+_logging_initialized = False
 
 def initialize_logging():
+    # logging.conf is parsed once per process, however many times the application is imported.
+    global _logging_initialized
+    if _logging_initialized:
+        return
     log_config_rel_path = os.path.join(os.path.dirname(__file__), '..', '..', 'logging.conf')
     log_config_abs_path = os.path.abspath(log_config_rel_path)
     logging.config.fileConfig(log_config_abs_path, disable_existing_loggers=False)
+    volume_filter = LogVolumeFilter(settings.log_rate_limits, settings.log_sample_rates) if settings.log_rate_limits or settings.log_sample_rates else None
+    if settings.log_queue:
+        install_queue_logging(volume_filter)
+    elif volume_filter is not None:
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(volume_filter)
+    _logging_initialized = True
 
 def verify_credentials(user_id: str, user_pass: str):
-    if user_id == ADMIN_USER and user_pass == ADMIN_PASSWORD:
+    if user_id == settings.admin_user and user_pass == settings.admin_password:
         return {"username": user_id}
-    logging.warning(f"User verification failed: {user_id}")
+    logger.warning("User verification failed: %s", user_id)
     return None
 
 def issue_token(data: dict, expires_delta: timedelta = None):
     token_data = data.copy()
     expiration_time = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
     token_data["exp"] = expiration_time
-    return jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
+    from jose import jwt  # Deferred: python-jose is slow to import and only needed for token work.
+    return jwt.encode(token_data, settings.secret_key, algorithm=settings.algorithm)
+
+def decode_token(token: str) -> dict:
+    # Verifies the signature and the expiry, which every token must carry; raises ValueError otherwise.
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm], options={"require_exp": True})
+    except JWTError as error:
+        raise ValueError(str(error)) from error
 
 def confirm_and_clean_url(provided_url: str):
     # Ensure the URL is a string when parsed
-    parsed_url = urlparse(str(provided_url))
-    if parsed_url.scheme and parsed_url.netloc:
-        return urlunparse(parsed_url)
-    logging.error(f"URL check failed for: {provided_url}")
+    with stage("validate_url"):
+        parsed_url = urlparse(str(provided_url))
+        if parsed_url.scheme and parsed_url.netloc:
+            return urlunparse(parsed_url)
+    logger.error("URL check failed for: %s", provided_url)
     return None
 
 def url_to_safe_string(valid_url):
     # Ensure the URL is converted to string if it's a special Pydantic URL type
     if clean_url := confirm_and_clean_url(str(valid_url)):
-        return base64.urlsafe_b64encode(clean_url.encode('utf-8')).decode('utf-8').rstrip('=')
+        with stage("naming"):
+            return base64.urlsafe_b64encode(clean_url.encode('utf-8')).decode('utf-8').rstrip('=')
     raise ValueError("URL is invalid and cannot be transformed.")
 
 
@@ -50,14 +72,14 @@ def base64_to_url(safe_string: str) -> str:
     original_url_bytes = base64.urlsafe_b64decode(safe_string)
     return original_url_bytes.decode('utf-8')
 
-def craft_resource_links(verb: str, qr_file: str, api_base: str, qr_download_link: str):
+def craft_resource_links(verb: str, qr_file: str, api_base: str, qr_download_link: str, content_type: str = "image/png"):
     links = []
     if verb == "create":
         links.append({
             "relation": "view",
             "target": qr_download_link,
             "method": "GET",
-            "content_type": "image/png"
+            "content_type": content_type
         })
     if verb in ["create", "delete"]:
         qr_delete_endpoint = f"{api_base}/qr-codes/{qr_file}"
@@ -0,0 +1,115 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Mapping, Optional
+
+from app.utils.metrics import registry
+
+
+class LogVolumeFilter(logging.Filter):
+    """
+    Caps how many records each logger may emit, so a burst of traffic cannot turn into a burst of log I/O.
+
+    Limits are configured per logger name and apply to its children too (the most specific
+    name wins, as with logger levels):
+    - `rate_limits`: records per second, enforced with a token bucket holding one second of burst.
+      Applies to every level, so an error storm is throttled as well.
+    - `sample_rates`: fraction (0.0-1.0) of DEBUG and INFO records kept. Warnings and errors are never sampled out.
+
+    The next record that gets through after some were dropped carries a note saying how many were suppressed.
+    """
+
+    def __init__(self, rate_limits: Optional[Mapping[str, float]] = None, sample_rates: Optional[Mapping[str, float]] = None):
+        super().__init__()
+        self.rate_limits = dict(rate_limits or {})
+        self.sample_rates = dict(sample_rates or {})
+        self._buckets: Dict[str, List[float]] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lookup(settings: Dict[str, float], logger_name: str) -> Optional[float]:
+        name = logger_name
+        while name:
+            if name in settings:
+                return settings[name]
+            name = name.rpartition(".")[0]
+        return settings.get("root")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample_rate = self._lookup(self.sample_rates, record.name)
+        if sample_rate is not None and record.levelno < logging.WARNING and random.random() >= sample_rate:
+            self._drop(record.name, "sampled")
+            return False
+        rate = self._lookup(self.rate_limits, record.name)
+        if rate is not None and not self._take_token(record.name, rate):
+            self._drop(record.name, "rate_limited")
+            return False
+        suppressed = self._suppressed.pop(record.name, 0)
+        if suppressed:
+            record.msg = f"{str(record.msg)} [{suppressed} earlier record(s) from this logger suppressed]"
+        return True
+
+    def _take_token(self, logger_name: str, rate: float, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.setdefault(logger_name, [rate, now])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def _drop(self, logger_name: str, reason: str):
+        registry.inc("log_records_dropped_total", logger=logger_name, reason=reason)
+        if reason == "rate_limited":
+            with self._lock:
+                self._suppressed[logger_name] = self._suppressed.get(logger_name, 0) + 1
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler renders the message in the calling thread; here the record is queued
+    as-is, so the request path only pays for creating the record and putting it on the queue.
+    Arguments are therefore rendered later, which is fine for the immutable values the service logs.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def install_queue_logging(volume_filter: Optional[LogVolumeFilter] = None,
+                          target: Optional[logging.Logger] = None) -> logging.handlers.QueueListener:
+    """
+    Move a logger's handlers (the root logger's by default) behind a queue served by a background thread.
+
+    The handlers configured by logging.conf keep their levels and formatters, but they now
+    run on the listener thread, so slow stdout or file writes no longer block the event loop.
+
+    Arguments:
+    - volume_filter (LogVolumeFilter): Optional rate-limiting / sampling filter applied before queueing.
+    - target (logging.Logger): Logger whose handlers are moved; the root logger when omitted.
+
+    Returns:
+    - The running QueueListener; it is stopped, and the queue drained, at interpreter exit.
+    """
+    target = target or logging.getLogger()
+    handlers = [handler for handler in target.handlers if not isinstance(handler, logging.handlers.QueueHandler)]
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    if volume_filter is not None:
+        queue_handler.addFilter(volume_filter)
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
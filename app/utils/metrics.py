@@ -0,0 +1,227 @@
+import cProfile
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style, recording one observation in O(log buckets).
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    In-process store of counters and histograms, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0.0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in self._counters.items():
+            lines.extend(_header(name, "counter", self._help.get(name)))
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in series.items())
+        for name, series in self._histograms.items():
+            lines.extend(_header(name, "histogram", self._help.get(name)))
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def render_gauges(prefix: str, samples: Dict[str, float]) -> str:
+    """
+    Render a stats dictionary as gauges named `<prefix>_<key>` in the Prometheus text format.
+    """
+    lines: List[str] = []
+    for key, value in samples.items():
+        lines.extend(_header(f"{prefix}_{key}", "gauge", None))
+        lines.append(f"{prefix}_{key} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _header(name: str, metric_type: str, help_text: Optional[str]) -> List[str]:
+    header = [f"# HELP {name} {help_text}"] if help_text else []
+    header.append(f"# TYPE {name} {metric_type}")
+    return header
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Process-wide registry exposed at /metrics.
+registry = MetricsRegistry()
+registry.describe("qr_stage_duration_seconds", "Time spent in each stage of QR code creation.")
+registry.describe("http_request_duration_seconds", "Request latency per endpoint.")
+registry.describe("http_requests_total", "Requests handled per endpoint and status code.")
+registry.describe("qr_storage_bytes_written_total", "Bytes of QR images written to storage.")
+registry.describe("log_records_dropped_total", "Log records dropped by sampling or rate limiting, per logger.")
+
+_recording = threading.local()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block of QR processing and record it under `qr_stage_duration_seconds{stage=name}`.
+
+    Inside a render worker (see `run_instrumented`) durations are collected and sent back
+    with the job's result instead, so they end up in the parent process's registry.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        recorder = getattr(_recording, "stages", None)
+        if recorder is not None:
+            recorder.append((name, elapsed))
+        else:
+            registry.observe("qr_stage_duration_seconds", elapsed, stage=name)
+
+
+def run_instrumented(func, *args):
+    """
+    Call `func(*args)` while collecting stage timings; meant to run inside a render worker.
+
+    Returns:
+    - A tuple of the function's result and the list of (stage, seconds) it recorded.
+    """
+    _recording.stages = []
+    try:
+        return func(*args), _recording.stages
+    finally:
+        _recording.stages = None
+
+
+def record_stages(timings: List[Tuple[str, float]]):
+    """
+    Record stage timings collected by `run_instrumented` into this process's registry.
+    """
+    for name, elapsed in timings:
+        registry.observe("qr_stage_duration_seconds", elapsed, stage=name)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and status counts per endpoint.
+
+    Endpoints are labelled with their route template (e.g. /qr-codes/{qr_img_name})
+    to keep label cardinality bounded. A sampled fraction of requests can be run
+    under cProfile; profiles of requests slower than the threshold are written to
+    `profile_dir` for inspection with pstats or snakeviz. Only one request is
+    profiled at a time, and the profile covers everything the event loop ran
+    meanwhile.
+    """
+
+    def __init__(self, app, profile_sample_rate: float = 0.0, profile_slow_seconds: float = 0.5, profile_dir: Path = Path("profiles")):
+        self.app = app
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_slow_seconds = profile_slow_seconds
+        self.profile_dir = profile_dir
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        profiler = None
+        if self.profile_sample_rate and not self._profiling and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                if elapsed >= self.profile_slow_seconds:
+                    self._dump_profile(profiler, endpoint, elapsed)
+            registry.observe("http_request_duration_seconds", elapsed, endpoint=endpoint, method=scope["method"])
+            registry.inc("http_requests_total", endpoint=endpoint, method=scope["method"], status=str(status_code))
+
+    def _dump_profile(self, profiler: cProfile.Profile, endpoint: str, elapsed: float):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        safe_endpoint = "".join(char if char.isalnum() else "_" for char in endpoint).strip("_") or "root"
+        profile_path = self.profile_dir / f"{int(time.time() * 1000)}-{safe_endpoint}.prof"
+        profiler.dump_stats(str(profile_path))
+        logger.warning("Slow request to %s took %.1f ms; profile saved to %s", endpoint, elapsed * 1000, profile_path)
@@ -0,0 +1,34 @@
+import logging
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Set when app.main starts importing this module, before FastAPI and the routers are loaded.
+_started = time.perf_counter()
+_timings: Dict[str, float] = {}
+
+
+def mark(phase: str):
+    """
+    Record the seconds elapsed since the application started importing, as `<phase>_seconds`.
+    """
+    _timings[f"{phase}_seconds"] = time.perf_counter() - _started
+
+
+def stats() -> Dict[str, float]:
+    return dict(_timings)
+
+
+def preload():
+    """
+    Import the QR rendering and JWT libraries now instead of on first use.
+
+    They are deferred by default so that workers boot quickly (see QR_PRELOAD).
+    """
+    began = time.perf_counter()
+    import jose.jwt  # noqa: F401
+    import numpy  # noqa: F401
+    import qrcode  # noqa: F401
+    _timings["preload_seconds"] = time.perf_counter() - began
+    logger.info("Preloaded rendering and token libraries in %.0f ms", _timings['preload_seconds'] * 1000)
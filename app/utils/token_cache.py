@@ -0,0 +1,92 @@
+import heapq
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+
+class VerifiedTokenCache:
+    """
+    Bounded cache of access tokens whose signature has already been verified.
+
+    Each entry lives until the token's own `exp` claim: lookups never return an
+    expired token, and expired entries are purged in expiry order (via a min-heap)
+    whenever a new token is stored. When the cache is full the least recently
+    used token is dropped. Hit/miss counts and time spent verifying are tracked.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self.hits = 0
+        self.misses = 0
+        self.verifications = 0
+        self.verify_seconds = 0.0
+
+    def get(self, token: str, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Return the verified claims for `token`, or None if it is unknown or expired.
+        """
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, expires_at = entry
+        if expires_at <= (time.time() if now is None else now):
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict, now: Optional[float] = None):
+        """
+        Remember verified claims until their `exp`. Tokens without an expiry are not cached.
+        """
+        expires_at = claims.get("exp")
+        if expires_at is None or self.max_entries <= 0:
+            return
+        self.purge_expired(now)
+        self._entries[token] = (claims, float(expires_at))
+        self._entries.move_to_end(token)
+        heapq.heappush(self._expiry_heap, (float(expires_at), token))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        # Entries dropped above leave stale heap items behind; rebuild once they dominate.
+        if len(self._expiry_heap) > 2 * self.max_entries:
+            self._expiry_heap = [(expiry, cached) for cached, (_, expiry) in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def purge_expired(self, now: Optional[float] = None):
+        """
+        Drop every entry whose token has expired.
+        """
+        now = time.time() if now is None else now
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expiry, token = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] == expiry:
+                del self._entries[token]
+
+    def record_verification(self, seconds: float):
+        self.verifications += 1
+        self.verify_seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "verifications": self.verifications,
+            "verify_seconds_total": self.verify_seconds,
+            "verify_seconds_avg": self.verify_seconds / self.verifications if self.verifications else 0.0,
+        }
+
+
+# Shared cache consulted by the bearer-token dependency.
+verified_tokens = VerifiedTokenCache(settings.token_cache_size)
@@ -0,0 +1,123 @@
+"""
+Reproducible benchmarks for the QR service.
+
+Usage:
+    python -m benchmarks micro  [--url-lengths 32,256] [--dimensions 10,30] [--iterations N] [--fast-encode] [--warmup N] [--output FILE]
+    python -m benchmarks macro  [--url-lengths 32,256] [--dimensions 10,30] [--concurrency 1,8] [--requests N] [--warmup N] [--output FILE]
+    python -m benchmarks replay LOG.jsonl [--concurrency N] [--repeat N] [--warmup N] [--output FILE]
+    python -m benchmarks compare BASELINE.json CURRENT.json [--threshold 0.10]
+
+`micro` times rendering and storing directly. `macro` and `replay` drive app.main:app
+in-process through httpx's ASGI transport, with its lifespan running, against a
+temporary storage directory and index (removed afterwards) unless --storage is given.
+Every run starts with --warmup untimed operations. Results are written as JSON (ops/s,
+p50/p95/p99 latency and peak RSS of the process and its render workers); `compare`
+exits with status 1 when CURRENT regresses against BASELINE.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from benchmarks.results import compare, write_results
+
+
+def _integers(value: str):
+    return [int(item) for item in value.split(",") if item]
+
+
+def _print_table(benchmarks):
+    print(f"{'benchmark':<56} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in benchmarks.items():
+        print(f"{name:<56} {result['ops_per_sec']:>10.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7}")
+
+
+def _use_storage(storage: Optional[str]) -> Optional[str]:
+    """
+    Point the application at `storage`, or at a fresh temporary directory holding both the
+    images and the index. Must run before app modules are imported, since they read their
+    settings at import time.
+
+    Returns:
+    - The temporary directory to remove afterwards, if one was created.
+    """
+    if storage:
+        os.environ["QR_STORAGE_DIRECTORY"] = storage
+        return None
+    scratch = tempfile.mkdtemp(prefix="qr-bench-")
+    os.environ["QR_STORAGE_DIRECTORY"] = os.path.join(scratch, "qr_codes")
+    os.environ["QR_INDEX_PATH"] = os.path.join(scratch, "index.sqlite3")
+    return scratch
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    micro = commands.add_parser("micro", help="Time rendering and storing directly, without HTTP.")
+    micro.add_argument("--url-lengths", type=_integers, default=[32, 256, 1024])
+    micro.add_argument("--dimensions", type=_integers, default=[10, 30])
+    micro.add_argument("--iterations", type=int, default=50)
+    micro.add_argument("--fast-encode", action="store_true")
+    micro.add_argument("--warmup", type=int, default=5, help="Untimed calls per parameter combination.")
+
+    macro = commands.add_parser("macro", help="Drive the application through the ASGI transport.")
+    macro.add_argument("--url-lengths", type=_integers, default=[32, 256])
+    macro.add_argument("--dimensions", type=_integers, default=[10, 30])
+    macro.add_argument("--concurrency", type=_integers, default=[1, 8])
+    macro.add_argument("--requests", type=int, default=100, help="Requests per parameter combination.")
+    macro.add_argument("--warmup", type=int, default=10, help="Untimed requests per parameter combination.")
+    macro.add_argument("--storage", help="Storage directory to use instead of a temporary one.")
+
+    replay = commands.add_parser("replay", help="Replay a JSONL request log against the application.")
+    replay.add_argument("log", type=Path)
+    replay.add_argument("--concurrency", type=int, default=8)
+    replay.add_argument("--repeat", type=int, default=1)
+    replay.add_argument("--warmup", type=int, default=10, help="Untimed requests before the log is replayed.")
+    replay.add_argument("--storage", help="Storage directory to use instead of a temporary one.")
+
+    for command in (micro, macro, replay):
+        command.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+
+    comparison = commands.add_parser("compare", help="Flag regressions between two result files.")
+    comparison.add_argument("baseline", type=Path)
+    comparison.add_argument("current", type=Path)
+    comparison.add_argument("--threshold", type=float, default=0.10, help="Tolerated relative change (0.10 = 10%%).")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressions = compare(json.loads(args.baseline.read_text()), json.loads(args.current.read_text()), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    if args.command == "micro":
+        from benchmarks.micro import run_micro
+        benchmarks = run_micro(args.url_lengths, args.dimensions, args.iterations, args.fast_encode, args.warmup)
+    else:
+        scratch = _use_storage(args.storage)
+        try:
+            from benchmarks.macro import run_macro, run_replay
+            if args.command == "macro":
+                benchmarks = asyncio.run(run_macro(args.url_lengths, args.dimensions, args.concurrency, args.requests, args.warmup))
+            else:
+                benchmarks = asyncio.run(run_replay(args.log, args.concurrency, args.repeat, args.warmup))
+        finally:
+            if scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    _print_table(benchmarks)
+    if args.output:
+        write_results(args.output, args.command, benchmarks)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
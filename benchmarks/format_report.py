@@ -0,0 +1,43 @@
+"""
+Report output size and render time for every QR output format.
+
+Usage:
+    python -m benchmarks.format_report [--repeat N]
+
+PNG is reported at several zlib levels so a default for QR_PNG_COMPRESSION
+can be chosen; the other formats are reported once per module size. Only
+the image step is timed, the QR matrix is encoded once per size.
+"""
+import argparse
+import timeit
+
+from app.services.png_raster import encode_png
+from app.services.qr_formats import encode_pbm, resolve_color, svg_chunks
+from app.services.qr_service import build_qr_matrix
+
+SAMPLE_URL = "https://example.org/campaigns/2024/spring?utm_source=print&utm_medium=qr"
+MODULE_SIZES = (4, 12, 20, 40)
+PNG_LEVELS = (1, 6, 9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per format and size.")
+    args = parser.parse_args()
+
+    matrix = build_qr_matrix(SAMPLE_URL)
+    palette = (resolve_color("black"), resolve_color("white"))
+    formats = {f"png (zlib {level})": (lambda box, level=level: encode_png(matrix, box, palette=palette, compress_level=level))
+               for level in PNG_LEVELS}
+    formats["svg"] = lambda box: "".join(svg_chunks(matrix, box, "black", "white")).encode("utf-8")
+    formats["pbm"] = lambda box: encode_pbm(matrix, box)
+
+    print(f"{'size':>5} {'format':>14} {'ms/image':>10} {'bytes':>9}")
+    for box_size in MODULE_SIZES:
+        for name, render in formats.items():
+            seconds = min(timeit.repeat(lambda: render(box_size), number=1, repeat=args.repeat))
+            print(f"{box_size:>5} {name:>14} {seconds * 1000:>10.3f} {len(render(box_size)):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Macro benchmarks: drive the whole application (app.main:app) in-process through
+httpx's ASGI transport, so routing, auth, validation, rendering and storage are
+all included while the network is not.
+
+The transport does not run the application's lifespan, so the runners enter it
+themselves: the render pool is started before anything is timed, as in a server.
+Untimed warm-up requests then fill the caches of each measured configuration.
+"""
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from benchmarks.micro import make_url
+from benchmarks.results import sample_worker_rss, summarize
+
+
+async def _token(client) -> str:
+    from app.config import settings
+
+    response = await client.post("/token", data={"username": settings.admin_user, "password": settings.admin_password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _drive(client, requests: List[Tuple[str, str, Optional[dict]]], concurrency: int, headers: dict,
+                 created: List[str]) -> Tuple[List[float], int, float]:
+    """
+    Send `requests` with at most `concurrency` in flight.
+
+    Delete endpoints of the QR codes created along the way are appended to `created`.
+
+    Returns:
+    - The per-request latencies, the number of failed requests and the wall time in seconds.
+    """
+    queue = iter(requests)
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for method, path, body in queue:
+            begin = time.perf_counter()
+            response = await client.request(method, path, json=body, headers=headers)
+            latencies.append(time.perf_counter() - begin)
+            if response.status_code >= 500 or response.status_code in (401, 422):
+                errors += 1
+            elif method == "POST" and response.status_code == 201:
+                created.extend(link["target"] for link in response.json()["navigation_links"] if link["relation"] == "delete")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def _cleanup(client, headers: dict, created: List[str]):
+    # Only remove what the benchmark itself created; the storage may hold real codes.
+    for target in created:
+        await client.delete("/qr-codes/" + target.rsplit("/", 1)[-1], headers=headers)
+    created.clear()
+
+
+def _create_requests(url_length: int, module_size: int, count: int) -> List[Tuple[str, str, Optional[dict]]]:
+    run_id = uuid.uuid4().hex[:8]
+    return [
+        ("POST", "/qr-codes/", {"target_url": make_url(url_length, f"{run_id}-{serial}"), "dimensions": module_size})
+        for serial in range(count)
+    ]
+
+
+async def run_macro(url_lengths: Sequence[int], dimensions: Sequence[int], concurrency_levels: Sequence[int], requests_per_run: int,
+                    warmup: int = 10) -> Dict[str, Dict]:
+    from httpx import ASGITransport, AsyncClient
+    from app.main import app
+
+    results = {}
+    async with app.router.lifespan_context(app), AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+        headers = {"Authorization": f"Bearer {await _token(client)}"}
+        created: List[str] = []
+        for url_length, module_size, concurrency in itertools.product(url_lengths, dimensions, concurrency_levels):
+            # Untimed: the first requests of a configuration pay for cold caches in the app and the render workers.
+            await _drive(client, _create_requests(url_length, module_size, warmup), concurrency, headers, created)
+            await _drive(client, [("GET", "/qr-codes/", None)] * warmup, concurrency, headers, created)
+            await _cleanup(client, headers, created)
+
+            latencies, errors, wall = await _drive(client, _create_requests(url_length, module_size, requests_per_run), concurrency, headers, created)
+            sample_worker_rss()
+            name = f"POST /qr-codes/[url={url_length},dim={module_size},c={concurrency}]"
+            results[name] = summarize(latencies, wall, errors, url_length=url_length, dimensions=module_size, concurrency=concurrency)
+
+            latencies, errors, wall = await _drive(client, [("GET", "/qr-codes/", None)] * requests_per_run, concurrency, headers, created)
+            results[f"GET /qr-codes/[url={url_length},dim={module_size},c={concurrency}]"] = summarize(
+                latencies, wall, errors, url_length=url_length, dimensions=module_size, concurrency=concurrency)
+            await _cleanup(client, headers, created)
+    return results
+
+
+def load_request_log(path: Path) -> List[Tuple[str, str, Optional[dict]]]:
+    """
+    Read a JSONL request log. Each line is either a request record
+    ({"method": ..., "path": ..., "json": ...}) or a bare EncodeURLRequest
+    payload, which is replayed as POST /qr-codes/.
+    """
+    requests = []
+    for line in path.read_text().splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "method" in record and "path" in record:
+            requests.append((record["method"].upper(), record["path"], record.get("json")))
+        else:
+            requests.append(("POST", "/qr-codes/", record))
+    return requests
+
+
+async def run_replay(log_path: Path, concurrency: int, repeat: int, warmup: int = 10) -> Dict[str, Dict]:
+    from httpx import ASGITransport, AsyncClient
+    from app.main import app
+
+    requests = load_request_log(log_path) * repeat
+    async with app.router.lifespan_context(app), AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+        headers = {"Authorization": f"Bearer {await _token(client)}"}
+        created: List[str] = []
+        # Synthetic and untimed, so the log's own requests are all measured and none of them turns into a duplicate.
+        await _drive(client, _create_requests(64, 10, warmup), concurrency, headers, created)
+        await _cleanup(client, headers, created)
+        latencies, errors, wall = await _drive(client, requests, concurrency, headers, created)
+        sample_worker_rss()
+        await _cleanup(client, headers, created)
+    return {f"replay[{log_path.name},c={concurrency}]": summarize(latencies, wall, errors, log=str(log_path), concurrency=concurrency)}
@@ -0,0 +1,53 @@
+"""
+Micro benchmarks: render a QR code and write it to storage directly, without HTTP or the render pool.
+"""
+import asyncio
+import itertools
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Sequence
+
+from benchmarks.results import summarize
+
+
+def make_url(length: int, tag: str) -> str:
+    prefix = f"https://example.org/{tag}/"
+    return prefix + "a" * max(0, length - len(prefix))
+
+
+def run_micro(url_lengths: Sequence[int], dimensions: Sequence[int], iterations: int, fast_encode: bool = False,
+              warmup: int = 5) -> Dict[str, Dict]:
+    with tempfile.TemporaryDirectory() as storage:
+        return asyncio.run(_run_micro(Path(storage), url_lengths, dimensions, iterations, fast_encode, warmup))
+
+
+async def _run_micro(root: Path, url_lengths: Sequence[int], dimensions: Sequence[int], iterations: int, fast_encode: bool,
+                     warmup: int) -> Dict[str, Dict]:
+    from app.config import settings
+    from app.services.qr_service import render_qr_image
+    from app.services.qr_storage import open_storage
+
+    # The configured backend, so the numbers include its write path (e.g. fsync).
+    storage = open_storage(settings.qr_storage_backend, root)
+    storage.open()
+    results = {}
+    try:
+        for url_length, module_size in itertools.product(url_lengths, dimensions):
+            # Untimed: the first calls pay for importing qrcode and for cold caches.
+            for serial in range(warmup):
+                image_bytes = render_qr_image(make_url(url_length, f"warmup-{serial}"), "black", "white", module_size, 'M', fast_encode)
+                await storage.put("warmup.png", image_bytes)
+            latencies = []
+            started = time.perf_counter()
+            for serial in range(iterations):
+                begin = time.perf_counter()
+                image_bytes = render_qr_image(make_url(url_length, str(serial)), "black", "white", module_size, 'M', fast_encode)
+                await storage.put(f"{url_length}-{module_size}-{serial}.png", image_bytes)
+                latencies.append(time.perf_counter() - begin)
+            wall = time.perf_counter() - started
+            name = f"render_and_store[url={url_length},dim={module_size}{',fast' if fast_encode else ''}]"
+            results[name] = summarize(latencies, wall, url_length=url_length, dimensions=module_size, fast_encode=fast_encode)
+    finally:
+        storage.close()
+    return results
@@ -0,0 +1,61 @@
+"""
+Compare the NumPy rasterizer with qrcode's own image backends.
+
+Usage:
+    python -m benchmarks.raster_bench [--repeat N]
+
+For every module size the QR code is encoded once; only the image step
+(matrix to PNG bytes) is timed. The PIL backend is included when Pillow
+is installed.
+"""
+import argparse
+import io
+import timeit
+
+import qrcode
+from qrcode.image.pure import PyPNGImage
+
+from app.services.png_raster import encode_png
+
+SAMPLE_URL = "https://example.org/campaigns/2024/spring?utm_source=print&utm_medium=qr"
+MODULE_SIZES = (1, 5, 12, 20, 30, 40)
+
+
+def _encoded(box_size: int) -> qrcode.QRCode:
+    qr_instance = qrcode.QRCode(version=1, box_size=box_size, border=5)
+    qr_instance.add_data(SAMPLE_URL)
+    qr_instance.make(fit=True)
+    return qr_instance
+
+
+def _save(qr_instance: qrcode.QRCode, **image_options) -> bytes:
+    buffer = io.BytesIO()
+    qr_instance.make_image(**image_options).save(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per backend and size.")
+    args = parser.parse_args()
+
+    backends = {
+        "pypng": lambda qr: _save(qr, image_factory=PyPNGImage),
+        "numpy": lambda qr: encode_png(qr.get_matrix(), qr.box_size),
+    }
+    from qrcode.image.pil import Image, PilImage
+    if Image is not None:
+        backends["pil"] = lambda qr: _save(qr, image_factory=PilImage, fill_color="black", back_color="white")
+
+    print(f"{'size':>5} {'backend':>8} {'ms/image':>10} {'bytes':>8} {'speedup':>8}")
+    for box_size in MODULE_SIZES:
+        qr_instance = _encoded(box_size)
+        baseline = None
+        for name, render in backends.items():
+            seconds = min(timeit.repeat(lambda: render(qr_instance), number=1, repeat=args.repeat))
+            baseline = baseline or seconds
+            print(f"{box_size:>5} {name:>8} {seconds * 1000:>10.3f} {len(render(qr_instance)):>8} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Result records shared by the benchmark runners: latency summaries, peak RSS,
+JSON persistence and regression comparison against a saved baseline.
+"""
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+# Peak RSS, in kilobytes, of every worker process seen by sample_worker_rss.
+_worker_peaks_kb: Dict[int, int] = {}
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of `samples` (fraction between 0 and 1).
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float], wall_seconds: float, errors: int = 0, **parameters) -> Dict:
+    """
+    Summarize per-operation latencies (seconds) measured over `wall_seconds` of wall-clock time.
+    """
+    return {
+        "parameters": parameters,
+        "operations": len(latencies),
+        "errors": errors,
+        "ops_per_sec": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def _process_peak_kb(pid: int) -> int:
+    # VmHWM is the peak resident set of a running process (Linux only).
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def sample_worker_rss():
+    """
+    Record the peak RSS of the live child processes (the render pool), so it is still
+    counted once they have exited. Call it while the workers are running.
+    """
+    for child in multiprocessing.active_children():
+        _worker_peaks_kb[child.pid] = max(_worker_peaks_kb.get(child.pid, 0), _process_peak_kb(child.pid))
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    Peak RSS of this process and of its worker processes (the sum of each worker's peak), in megabytes.
+    """
+    sample_worker_rss()
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    # Without /proc, fall back to the largest child that has already exited.
+    workers = sum(_worker_peaks_kb.values()) / 1024 or resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"main": main, "workers": workers, "total": main + workers}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(path: Path, suite: str, benchmarks: Dict[str, Dict]):
+    report = {
+        "suite": suite,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "peak_rss_mb": peak_rss_mb(),
+        "benchmarks": benchmarks,
+    }
+    path.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[str]:
+    """
+    List regressions of `current` against `baseline`.
+
+    A benchmark regresses when its throughput drops, or its p99 latency grows, by more
+    than `threshold` (a fraction). Benchmarks present in only one report are ignored.
+    """
+    regressions = []
+    for name, before in baseline.get("benchmarks", {}).items():
+        after = current.get("benchmarks", {}).get(name)
+        if after is None:
+            continue
+        if before["ops_per_sec"] and after["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: ops/s {before['ops_per_sec']:.1f} -> {after['ops_per_sec']:.1f}")
+        if before["p99_ms"] and after["p99_ms"] > before["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {before['p99_ms']:.2f} ms -> {after['p99_ms']:.2f} ms")
+    return regressions
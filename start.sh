@@ -5,5 +5,8 @@
 
 # Start the FastAPI application for local
 uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
-# start for production
-# gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b :8000 app.main:app
\ No newline at end of file
+# start for production. WEB_CONCURRENCY sets the worker count and is read by the app as well,
+# so each worker's render pool gets its share of the CPUs instead of all of them.
+# QR_STORAGE_BACKEND=segments supports one process only and refuses to start with WEB_CONCURRENCY above 1.
+# export WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+# gunicorn -k uvicorn.workers.UvicornWorker -w $WEB_CONCURRENCY -b :8000 app.main:app
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.services.admission import AdmissionController, Overloaded, admission
+
+
+async def _hold(controller, release, order, name, client=None):
+    async with controller.admit(1, client):
+        order.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_queue_is_bounded_and_served_in_turn_per_client():
+    controller = AdmissionController(max_concurrent=1, max_queue=3, queue_deadline=5)
+    release, order = asyncio.Event(), []
+    tasks = [asyncio.create_task(_hold(controller, release, order, "first"))]
+    await asyncio.sleep(0)
+    for name, client in (("a1", "a"), ("a2", "a"), ("b1", "b")):
+        tasks.append(asyncio.create_task(_hold(controller, release, order, name, client)))
+        await asyncio.sleep(0)
+    assert controller.stats()["queued"] == 3
+
+    with pytest.raises(Overloaded) as refused:
+        async with controller.admit(1, "c"):
+            pass
+    assert refused.value.reason == "queue_full"
+    assert refused.value.retry_after >= 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    # Client b is served before client a's second request.
+    assert order == ["first", "a1", "b1", "a2"]
+    assert controller.stats()["running"] == controller.stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_requests_over_the_deadline_are_refused_at_once():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, queue_deadline=1, client_share=0.2)
+    controller.seconds_per_cost = 0.01
+    release, order = asyncio.Event(), []
+    running = asyncio.create_task(_hold(controller, release, order, "running"))
+    await asyncio.sleep(0)
+    # 50 cost units take about 0.5 s, within the deadline; 200 more would not be.
+    queued = asyncio.create_task(_hold(controller, release, order, "queued", "a"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as refused:
+        async with controller.admit(200, "b"):
+            pass
+    assert refused.value.reason == "deadline"
+    # Client a may hold 2 of the 10 queue places.
+    second = asyncio.create_task(_hold(controller, release, order, "second", "a"))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as refused:
+        async with controller.admit(1, "a"):
+            pass
+    assert refused.value.reason == "client_share"
+
+    release.set()
+    await asyncio.gather(running, queued, second)
+    assert controller.stats()["shed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_overloaded_render_is_answered_with_503(get_access_token_for_test, monkeypatch):
+    monkeypatch.setattr(admission, "max_queue", 0)
+    monkeypatch.setattr(admission, "running", admission.max_concurrent)
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9zaGVk.png", params={"dimensions": 37}, headers=headers)
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
@@ -0,0 +1,32 @@
+import json
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.utils.common import url_to_safe_string
+
+@pytest.mark.asyncio
+async def test_batch_reports_per_item_status(get_access_token_for_test):
+    new_url = "https://example.org/batch-test"
+    items = [
+        {"target_url": new_url},
+        {"target_url": new_url},
+        {"target_url": "not a url"},
+    ]
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.post("/qr-codes/batch", json=items, headers=headers)
+        await client.delete(f"/qr-codes/{url_to_safe_string(new_url)}.png", headers=headers)
+    assert response.status_code == 200
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda item: item["index"])
+    assert [item["index"] for item in results] == [0, 1, 2]
+    assert sorted(item["status_code"] for item in results[:2]) == [201, 409]
+    assert results[2]["status_code"] == 400
+
+@pytest.mark.asyncio
+async def test_batch_accepts_ndjson(get_access_token_for_test):
+    body = '{"target_url": "https://amazon.com"}\nnot json\n'
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}", "Content-Type": "application/x-ndjson"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.post("/qr-codes/batch", content=body, headers=headers)
+    statuses = {item["index"]: item["status_code"] for item in map(json.loads, response.text.splitlines())}
+    assert statuses == {0: 409, 1: 400}
@@ -0,0 +1,23 @@
+from benchmarks.results import compare, percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    samples = [float(value) for value in range(1, 101)]
+    assert percentile(samples, 0.50) == 50.0
+    assert percentile(samples, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_compare_flags_throughput_and_tail_regressions():
+    baseline = {"benchmarks": {
+        "render": summarize([0.010] * 100, 1.0),
+        "list": summarize([0.001] * 100, 0.1),
+    }}
+    current = {"benchmarks": {
+        "render": summarize([0.010] * 100, 1.05),
+        "list": summarize([0.001] * 98 + [0.005] * 2, 0.2),
+        "new": summarize([0.001], 0.001),
+    }}
+    regressions = compare(baseline, current, threshold=0.10)
+    assert len(regressions) == 2
+    assert all(regression.startswith("list:") for regression in regressions)
@@ -1,14 +1,14 @@
 # conftest.py
-import pytest
+import pytest_asyncio
 from httpx import AsyncClient
 from app.main import app  # Adjust import path as necessary
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def client():
     async with AsyncClient(app=app, base_url="http://testserver") as ac:
         yield ac
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def get_access_token_for_test(client):
     form_data = {"username": "admin", "password": "secret"}
     response = await client.post("/token", data=form_data)
@@ -0,0 +1,56 @@
+import pytest
+from httpx import AsyncClient
+
+from app.config import settings
+from app.main import app
+from app.routers.downloads import etag_matches, parse_byte_range
+from app.utils.common import url_to_safe_string
+
+
+def test_parse_byte_range():
+    assert parse_byte_range("bytes=0-9", 100) == (0, 9)
+    assert parse_byte_range("bytes=90-", 100) == (90, 99)
+    assert parse_byte_range("bytes=-10", 100) == (90, 99)
+    assert parse_byte_range("bytes=50-500", 100) == (50, 99)
+    assert parse_byte_range("bytes=0-1,5-6", 100) is None
+    assert parse_byte_range("items=0-1", 100) is None
+    with pytest.raises(ValueError):
+        parse_byte_range("bytes=100-", 100)
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert not etag_matches('"abc"', '"def"')
+
+
+@pytest.mark.asyncio
+async def test_download_is_conditional_and_ranged(get_access_token_for_test):
+    url = "https://example.org/download-test"
+    name = f"{url_to_safe_string(url)}.png"
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        created = await client.post("/qr-codes/", json={"target_url": url}, headers=headers)
+        full = await client.get(f"/{settings.file_serve_directory}/{name}", headers=headers)
+        etag = full.headers["etag"]
+        versioned = await client.get(created.json()["qr_link"], headers=headers)
+        cached = await client.get(f"/{settings.file_serve_directory}/{name}", headers={**headers, "If-None-Match": etag})
+        partial = await client.get(f"/{settings.file_serve_directory}/{name}", headers={**headers, "Range": "bytes=0-9"})
+        stale = await client.get(f"/{settings.file_serve_directory}/{name}", headers={**headers, "Range": "bytes=0-9", "If-Range": '"other"'})
+        unsatisfiable = await client.get(f"/{settings.file_serve_directory}/{name}", headers={**headers, "Range": "bytes=999999-"})
+        hidden = await client.get(f"/{settings.file_serve_directory}/.{name}", headers=headers)
+        await client.delete(f"/qr-codes/{name}", headers=headers)
+
+    assert created.status_code == 201
+    assert full.status_code == 200
+    assert full.content.startswith(b"\x89PNG")
+    assert full.headers["cache-control"] == "private, no-cache"
+    version = etag.strip('"')
+    assert created.json()["qr_link"].endswith(f"/{settings.file_serve_directory}/{name}?v={version}")
+    assert versioned.content == full.content
+    assert "immutable" in versioned.headers["cache-control"]
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert partial.status_code == 206
+    assert partial.content == full.content[:10]
+    assert partial.headers["content-range"] == f"bytes 0-9/{len(full.content)}"
+    assert stale.status_code == 200
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(full.content)}"
+    assert hidden.status_code == 404
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.services.expiry_sweeper import ExpirySweeper, expiry_sweeper
+from app.services.qr_index import QRIndex, qr_index
+from app.services.qr_service import claim_qr_name, release_qr_claim
+from app.services.qr_storage import DirectoryStorage
+from app.utils.common import url_to_safe_string
+
+
+@pytest.mark.asyncio
+async def test_sweeper_deletes_only_expired_codes(tmp_path):
+    storage = DirectoryStorage(tmp_path / "codes")
+    storage.open()
+    index = QRIndex(tmp_path / "index.sqlite3", storage)
+    now = time.time()
+    names = {}
+    for label, expires_at in (("old", now - 10), ("later", now + 3600), ("kept", None)):
+        url = f"https://example.org/{label}"
+        names[label] = f"{url_to_safe_string(url)}.png"
+        await storage.put(names[label], b"png")
+        index.add(names[label], url, "black", "white", 12, 3, expires_at)
+
+    sweeper = ExpirySweeper(index, storage, interval=30, batch_size=10, deletes_per_second=0)
+    # Claims are taken next to the sweeper's own storage, so one held by a writer is respected.
+    claim = await claim_qr_name(storage.claim_target(names["old"]))
+    assert await sweeper.sweep_once(now) == 0
+    await release_qr_claim(claim)
+    assert await sweeper.sweep_once(now) == 1
+    assert sorted(storage.names()) == sorted([names["kept"], names["later"]])
+    assert index.next_expiry() == pytest.approx(now + 3600)
+
+    assert index.mark_expired(now, url_prefix="https://example.org/k") == 1
+    assert await sweeper.sweep_once(now) == 1
+    assert storage.names() == [names["later"]]
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_expire_marks_codes_for_the_sweeper(get_access_token_for_test):
+    url = "https://example.org/campaign/expiry-test"
+    name = f"{url_to_safe_string(url)}.png"
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        both = await client.post("/qr-codes/", json={"target_url": url, "ttl_seconds": 60, "expires_at": "2030-01-01T00:00:00Z"}, headers=headers)
+        created = await client.post("/qr-codes/", json={"target_url": url, "ttl_seconds": 3600}, headers=headers)
+        unfiltered = await client.delete("/qr-codes/", headers=headers)
+        marked = await client.delete("/qr-codes/", params={"url_prefix": "https://example.org/campaign/"}, headers=headers)
+    assert both.status_code == 422
+    assert created.status_code == 201
+    assert unfiltered.status_code == 400
+    assert marked.status_code == 202
+    assert marked.json() == {"marked": 1}
+
+    await expiry_sweeper.sweep_once()
+    assert not qr_index.exists(name)
@@ -0,0 +1,81 @@
+import io
+import struct
+import zipfile
+import zlib
+
+import pytest
+from httpx import AsyncClient
+
+from app.main import app
+from app.services.qr_export import export_archive_chunks
+from app.services.qr_storage import DirectoryStorage
+from app.services.segment_store import SegmentStorage
+from app.utils.common import url_to_safe_string
+
+
+def _open_storage(backend, root):
+    storage = DirectoryStorage(root) if backend == "directory" else SegmentStorage(root, 1024 * 1024)
+    storage.open()
+    return storage
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["directory", "segments"])
+async def test_archive_is_streamed_with_manifest(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr("app.services.qr_export.EXPORT_CHUNK_BYTES", 16)
+    storage = _open_storage(backend, tmp_path)
+    name = f"{url_to_safe_string('https://example.org/print')}.png"
+    await storage.put(name, bytes(range(100)))
+
+    chunks = list(export_archive_chunks(storage, [name, "missing.png"]))
+    assert len(chunks) > 7  # One piece per 16 byte chunk of the image, at least.
+    assert all(type(chunk) is bytes for chunk in chunks)
+    data = b"".join(chunks)
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.namelist() == ["manifest.csv", name]
+    info = archive.getinfo(name)
+    assert info.compress_type == zipfile.ZIP_STORED
+    # Size and CRC are in the local header, without a trailing data descriptor, so streaming readers accept it.
+    flags, _, _, _, crc, compressed_size, size = struct.unpack_from("<HHHHIII", data, info.header_offset + 6)
+    assert not flags & 0x08
+    assert (crc, compressed_size, size) == (zlib.crc32(bytes(range(100))), 100, 100)
+    assert archive.read(name) == bytes(range(100))
+    assert archive.read("manifest.csv").decode().splitlines() == ["name,url", f"{name},https://example.org/print", "missing.png,"]
+    storage.close()
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint_filters_by_url_prefix(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    urls = ["https://example.org/vendor/one", "https://example.org/vendor/two", "https://example.org/other"]
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        for url in urls:
+            await client.post("/qr-codes/", json={"target_url": url}, headers=headers)
+        response = await client.get("/qr-codes/export.zip", params={"url_prefix": "https://example.org/vendor/"}, headers=headers)
+        for url in urls:
+            await client.delete(f"/qr-codes/{url_to_safe_string(url)}.png", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == sorted(["manifest.csv"] + [f"{url_to_safe_string(url)}.png" for url in urls[:2]])
+    assert archive.read(f"{url_to_safe_string(urls[0])}.png").startswith(b"\x89PNG")
+
+
+def test_empty_export_still_has_a_manifest(tmp_path):
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(export_archive_chunks(DirectoryStorage(tmp_path), []))))
+    assert archive.read("manifest.csv").decode().splitlines() == ["name,url"]
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint_streams_from_segment_storage(tmp_path, monkeypatch, get_access_token_for_test):
+    storage = _open_storage("segments", tmp_path)
+    name = f"{url_to_safe_string('https://example.org/segments')}.png"
+    await storage.put(name, b"\x89PNG" + bytes(100))
+    monkeypatch.setattr("app.routers.qr_code.qr_storage", storage)
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.get("/qr-codes/export.zip", headers={"Authorization": f"Bearer {get_access_token_for_test}"})
+    storage.close()
+
+    assert response.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(response.content)).read(name) == b"\x89PNG" + bytes(100)
@@ -0,0 +1,24 @@
+import png
+import pytest
+import qrcode
+from app.services.qr_service import ERROR_CORRECTION_LEVELS, pick_version, render_qr_png
+
+@pytest.mark.parametrize("level", ["L", "M", "Q", "H"])
+def test_pick_version_matches_qrcode_best_fit(level):
+    for length in (1, 17, 40, 100, 271, 1000):
+        data = b"h" * length
+        qr_instance = qrcode.QRCode(error_correction=ERROR_CORRECTION_LEVELS[level])
+        qr_instance.add_data(data, optimize=0)
+        try:
+            expected = qr_instance.best_fit()
+        except qrcode.exceptions.DataOverflowError:
+            with pytest.raises(qrcode.exceptions.DataOverflowError):
+                pick_version(length, level)
+            continue
+        assert pick_version(length, level) == expected
+
+def test_fast_encode_renders_same_version_as_fit():
+    url = "https://example.org/fast"
+    fast = png.Reader(bytes=render_qr_png(url, module_size=1, error_correction="L", fast_encode=True)).read()
+    fitted = png.Reader(bytes=render_qr_png(url, module_size=1, error_correction="L")).read()
+    assert fast[:2] == fitted[:2]
@@ -0,0 +1,49 @@
+import atexit
+import logging
+import threading
+
+from app.utils.log_pipeline import LogVolumeFilter, install_queue_logging
+
+
+def _record(name: str, level: int = logging.INFO, message: str = "hello") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+
+def test_sampling_drops_info_but_keeps_warnings():
+    volume_filter = LogVolumeFilter(sample_rates={"app.routers": 0.0})
+    assert not volume_filter.filter(_record("app.routers.qr_code"))
+    assert volume_filter.filter(_record("app.routers.qr_code", logging.WARNING))
+    assert volume_filter.filter(_record("app.services.qr_service"))
+
+
+def test_rate_limit_applies_to_child_loggers_and_reports_suppressed_records():
+    volume_filter = LogVolumeFilter(rate_limits={"app": 2})
+    passed = [volume_filter.filter(_record("app.routers.qr_code")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+
+    # Refill the bucket: the next record through mentions what was dropped.
+    volume_filter._buckets["app.routers.qr_code"][0] = 2
+    record = _record("app.routers.qr_code")
+    assert volume_filter.filter(record)
+    assert "3 earlier record(s)" in record.getMessage()
+
+
+def test_queue_pipeline_formats_and_writes_on_listener_thread():
+    emitted = []
+
+    class CapturingHandler(logging.Handler):
+        def emit(self, record):
+            emitted.append((self.format(record), threading.current_thread().name))
+
+    logger = logging.getLogger("tests.log_pipeline")
+    logger.propagate = False
+    logger.addHandler(CapturingHandler())
+    listener = install_queue_logging(target=logger)
+    try:
+        logger.warning("stored %s", "abc.png")
+    finally:
+        listener.stop()
+        atexit.unregister(listener.stop)
+
+    assert [message for message, _ in emitted] == ["stored abc.png"]
+    assert emitted[0][1] != threading.current_thread().name
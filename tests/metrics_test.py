@@ -0,0 +1,40 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.utils.metrics import MetricsRegistry, stage, registry
+
+def test_registry_renders_prometheus_histograms():
+    metrics = MetricsRegistry()
+    metrics.describe("latency_seconds", "Example latency.")
+    metrics.observe("latency_seconds", 0.003, stage="encode")
+    metrics.observe("latency_seconds", 20.0, stage="encode")
+    metrics.inc("requests_total", status="201")
+    text = metrics.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{stage="encode",le="0.0025"} 0' in text
+    assert 'latency_seconds_bucket{stage="encode",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{stage="encode",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{stage="encode"} 2' in text
+    assert 'requests_total{status="201"} 1' in text
+
+def test_stage_records_duration():
+    before = registry.histogram("qr_stage_duration_seconds", stage="unit-test")
+    with stage("unit-test"):
+        pass
+    assert registry.histogram("qr_stage_duration_seconds", stage="unit-test").count == (before.count if before else 0) + 1
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_requests_and_stages(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        await client.post("/qr-codes/", json={"target_url": "https://amazon.com"}, headers=headers)
+        await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9tZXRyaWNz.png", headers=headers)
+        await client.get("/qr-codes/")
+        response = await client.get("/metrics")
+    assert response.status_code == 200
+    text = response.text
+    assert 'http_requests_total{endpoint="/qr-codes/",method="POST",status="409"}' in text
+    assert 'http_requests_total{endpoint="/qr-codes/",method="GET",status="401"}' in text
+    assert 'qr_stage_duration_seconds_count{stage="encode"}' in text
+    assert 'qr_stage_duration_seconds_count{stage="validate_url"}' in text
+    assert "qr_image_cache_hits" in text
@@ -0,0 +1,48 @@
+import threading
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.services.png_cache import PNGCache
+
+def test_png_cache_evicts_least_recently_used():
+    cache = PNGCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"90ab")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+
+@pytest.mark.asyncio
+async def test_image_endpoint_renders_then_serves_from_cache(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        first = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9jYWNoZQ.png?dimensions=3", headers=headers)
+        second = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9jYWNoZQ.png?dimensions=3", headers=headers)
+        missing = await client.get("/qr-codes/bm90LWEtdXJs.png", headers=headers)
+        oversized = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9jYWNoZQ.png?dimensions=41", headers=headers)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/png"
+    assert first.content.startswith(b"\x89PNG")
+    assert (first.headers["x-cache"], second.headers["x-cache"]) == ("MISS", "HIT")
+    assert second.content == first.content
+    assert missing.status_code == 404
+    assert oversized.status_code == 422
+
+def test_png_cache_is_consistent_across_threads():
+    cache = PNGCache(max_bytes=64)
+
+    def churn(offset):
+        for number in range(2000):
+            key = (offset + number) % 40
+            cache.put(key, b"x" * (key % 7 + 1))
+            cache.get((key + 1) % 40)
+
+    threads = [threading.Thread(target=churn, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats()["bytes"] == sum(len(value) for value in cache._entries.values()) <= 64
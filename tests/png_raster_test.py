@@ -0,0 +1,37 @@
+import dataclasses
+import io
+import png
+import pytest
+import qrcode
+from app.services import qr_service
+from app.services.png_raster import encode_png
+
+@pytest.mark.parametrize("box_size", [1, 3, 12, 21])
+def test_fast_raster_matches_pypng_output(box_size):
+    qr_instance = qrcode.QRCode(version=1, box_size=box_size, border=5)
+    qr_instance.add_data("https://example.org/a/reasonably/long/path?with=query")
+    qr_instance.make(fit=True)
+    reference = io.BytesIO()
+    qr_instance.make_image(image_factory=qrcode.image.pure.PyPNGImage).save(reference)
+
+    expected = png.Reader(bytes=reference.getvalue()).read()
+    actual = png.Reader(bytes=encode_png(qr_instance.get_matrix(), box_size)).read()
+    assert actual[:2] == expected[:2]
+    assert actual[3]["bitdepth"] == 1 and actual[3]["greyscale"]
+    assert [list(row) for row in actual[2]] == [list(row) for row in expected[2]]
+
+def test_fast_raster_palette():
+    width, height, rows, info = png.Reader(bytes=encode_png([[True, False]], 2, palette=((200, 0, 0), (255, 255, 255)))).read()
+    assert (width, height) == (4, 2)
+    assert info["palette"] == [(200, 0, 0), (255, 255, 255)]
+    assert [list(row) for row in rows] == [[0, 0, 1, 1], [0, 0, 1, 1]]
+
+@pytest.mark.parametrize("colors", [("black", "white"), ("darkviolet", "#fafafa"), ("crimson", "offwhite")])
+def test_fast_raster_matches_reference_path_with_colors(monkeypatch, colors):
+    monkeypatch.setattr(qr_service, "settings", dataclasses.replace(qr_service.settings, qr_fast_raster=False))
+    reference = png.Reader(bytes=qr_service.render_qr_png("https://example.org/colors", *colors, 3)).read()
+    monkeypatch.setattr(qr_service, "settings", dataclasses.replace(qr_service.settings, qr_fast_raster=True))
+    actual = png.Reader(bytes=qr_service.render_qr_png("https://example.org/colors", *colors, 3)).read()
+    assert actual[:2] == reference[:2]
+    assert actual[3]["palette"] == reference[3]["palette"] == [qr_service.resolve_color(color) for color in colors]
+    assert [list(row) for row in actual[2]] == [list(row) for row in reference[2]]
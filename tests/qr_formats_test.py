@@ -0,0 +1,40 @@
+import png
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.services.qr_formats import encode_pbm, negotiate_format, resolve_color, svg_chunks
+from app.services.qr_service import render_qr_png
+
+def test_negotiate_format():
+    assert negotiate_format("application/json") == "png"
+    assert negotiate_format("image/png;q=0.5, image/svg+xml") == "svg"
+    assert negotiate_format("image/svg+xml", requested="pbm") == "pbm"
+    assert negotiate_format(None, default="svg") == "svg"
+
+def test_svg_merges_runs_of_dark_modules():
+    svg = "".join(svg_chunks([[True, True, False, True], [False, False, False, False]], 2, "black", "#fff"))
+    assert 'width="8"' in svg and 'viewBox="0 0 4 4"' in svg
+    assert 'd="M0 0h2v1h-2zM3 0h1v1h-1z"' in svg
+    assert 'fill="#ffffff"' in svg
+
+def test_pbm_sets_bits_for_dark_pixels():
+    assert encode_pbm([[True, False]], 2) == b"P4\n4 2\n\xc0\xc0"
+
+def test_png_uses_configured_palette():
+    _, _, _, info = png.Reader(bytes=render_qr_png("https://example.org", "crimson", "offwhite", 1)).read()
+    assert info["palette"] == [resolve_color("crimson"), resolve_color("offwhite")]
+    with pytest.raises(ValueError):
+        resolve_color("not-a-color")
+
+@pytest.mark.asyncio
+async def test_image_endpoint_streams_svg(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9zdmc.svg?dimensions=4", headers=headers)
+        cached = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9zdmc.svg?dimensions=4", headers=headers)
+        unsupported = await client.get("/qr-codes/aHR0cHM6Ly9leGFtcGxlLm9yZy9zdmc.gif", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("image/svg+xml")
+    assert response.text.startswith("<?xml") and response.text.rstrip().endswith("</svg>")
+    assert cached.headers["x-cache"] == "HIT" and cached.content == response.content
+    assert unsupported.status_code == 422
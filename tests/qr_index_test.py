@@ -0,0 +1,27 @@
+from app.services.qr_index import QRIndex
+from app.services.qr_storage import DirectoryStorage
+from app.utils.common import url_to_safe_string
+
+def test_index_backfills_and_paginates(tmp_path):
+    storage = tmp_path / "qr_codes"
+    storage.mkdir()
+    names = [f"{url_to_safe_string(f'https://example.org/{number}')}.png" for number in range(5)]
+    for name in names:
+        (storage / name).write_bytes(b"png")
+    (storage / "_w.png").write_bytes(b"not ours")
+    (storage / "abcde.png").write_bytes(b"not ours")
+    index = QRIndex(tmp_path / "index.sqlite3", DirectoryStorage(storage))
+    index.open()
+
+    first_page = index.page(limit=3)
+    second_page = index.page(limit=3, after=first_page[-1]["name"])
+    assert [entry["name"] for entry in first_page + second_page] == sorted(names)
+    assert first_page[0]["byte_length"] == 3
+
+    assert index.exists(names[0])
+    assert index.remove(names[0])
+    assert not index.exists(names[0])
+    index.add(names[0], "https://example.org/0", "black", "white", 12, 42)
+    readded = next(entry for entry in index.page(limit=10) if entry["name"] == names[0])
+    assert readded["dimensions"] == 12
+    index.close()
@@ -0,0 +1,22 @@
+import pytest
+from app.services.qr_service import discard_partial_writes, remove_qr_image, store_qr_image
+
+@pytest.mark.asyncio
+async def test_store_qr_image_replaces_atomically(tmp_path):
+    destination = tmp_path / "code.png"
+    destination.write_bytes(b"old")
+    await store_qr_image(b"new image", destination)
+    assert destination.read_bytes() == b"new image"
+    assert [path.name for path in tmp_path.iterdir()] == ["code.png"]
+
+    await remove_qr_image(destination)
+    assert not destination.exists()
+    with pytest.raises(FileNotFoundError):
+        await remove_qr_image(destination)
+
+@pytest.mark.asyncio
+async def test_partial_writes_are_discarded(tmp_path):
+    await store_qr_image(b"complete", tmp_path / "kept.png")
+    (tmp_path / ".kept.png.0123.tmp").write_bytes(b"trunc")
+    discard_partial_writes(tmp_path)
+    assert [path.name for path in tmp_path.iterdir()] == ["kept.png"]
@@ -0,0 +1,21 @@
+import os
+import pytest
+from app.services.render_engine import RenderEngine
+
+@pytest.mark.asyncio
+async def test_render_engine_runs_jobs_in_worker_process():
+    engine = RenderEngine(workers=1, queue_depth=2)
+    try:
+        worker_pid = await engine.run(os.getpid)
+    finally:
+        engine.shutdown()
+    assert worker_pid != os.getpid()
+
+@pytest.mark.asyncio
+async def test_render_engine_thread_fallback():
+    engine = RenderEngine(workers=0, queue_depth=2)
+    try:
+        results = [await engine.run(pow, 2, exponent) for exponent in range(4)]
+    finally:
+        engine.shutdown()
+    assert results == [1, 2, 4, 8]
@@ -0,0 +1,128 @@
+import dataclasses
+
+import pytest
+
+from app.services import segment_store
+from app.services.segment_store import SegmentStorage
+
+
+def _open(root, segment_max_bytes=1024 * 1024):
+    storage = SegmentStorage(root, segment_max_bytes)
+    storage.open()
+    return storage
+
+
+@pytest.mark.asyncio
+async def test_segments_survive_reopen_with_tombstones(tmp_path):
+    storage = _open(tmp_path)
+    await storage.put("a.png", b"first")
+    await storage.put("b.png", b"second")
+    await storage.put("a.png", b"replaced")
+    await storage.delete("b.png")
+    with pytest.raises(FileNotFoundError):
+        await storage.delete("b.png")
+    assert bytes(storage.read("a.png")) == b"replaced"
+    storage.close()
+
+    reopened = _open(tmp_path)
+    assert reopened.names() == ["a.png"]
+    assert bytes(reopened.read("a.png")) == b"replaced"
+    assert reopened.stat("a.png")[0] == len(b"replaced")
+    with pytest.raises(FileNotFoundError):
+        reopened.read("b.png")
+    with pytest.raises(RuntimeError):
+        _open(tmp_path)
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_torn_record_is_truncated_on_open(tmp_path):
+    storage = _open(tmp_path)
+    await storage.put("kept.png", b"complete")
+    storage.close()
+    segment = next(tmp_path.glob("*.seg"))
+    intact_size = segment.stat().st_size
+    with open(segment, "ab") as partial:
+        partial.write(b"\x01\x00\x08\x00\x00\x01\x00")  # Header of a record cut short by a crash.
+
+    reopened = _open(tmp_path)
+    assert reopened.names() == ["kept.png"]
+    assert segment.stat().st_size == intact_size
+    await reopened.put("next.png", b"after")
+    assert bytes(reopened.read("next.png")) == b"after"
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_drops_dead_segments_and_keeps_deletes(tmp_path):
+    storage = _open(tmp_path, segment_max_bytes=200)
+    for number in range(6):
+        await storage.put(f"{number}.png", bytes(60))
+    for number in range(4):
+        await storage.delete(f"{number}.png")
+    segments_before = storage.stats()["segments"]
+    view = storage.read("5.png")
+
+    assert storage.compact() > 0
+    assert storage.stats()["segments"] < segments_before
+    assert storage.names() == ["4.png", "5.png"]
+    assert bytes(view) == bytes(60)  # Slices taken before compaction stay readable.
+    storage.close()
+
+    reopened = _open(tmp_path, segment_max_bytes=200)
+    assert reopened.names() == ["4.png", "5.png"]
+    assert bytes(reopened.read("4.png")) == bytes(60)
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_drops_tombstones_with_nothing_left_to_hide(tmp_path):
+    storage = _open(tmp_path, segment_max_bytes=2048)
+    await storage.put("kept.png", bytes(1900))  # Keeps the first segment alive throughout.
+    for round_number in range(12):
+        for number in range(40):
+            await storage.put(f"{round_number}-{number}.png", bytes(50))
+            await storage.delete(f"{round_number}-{number}.png")
+        storage.compact()
+    # Carrying every tombstone forward would have grown the store past 11 KB by now.
+    assert storage.stats()["records"] == 1
+    assert storage.stats()["bytes"] < 2 * 2048
+    storage.close()
+
+    reopened = _open(tmp_path, segment_max_bytes=2048)
+    assert reopened.names() == ["kept.png"]
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_remaps_segments_read_while_active(tmp_path):
+    storage = _open(tmp_path, segment_max_bytes=200)
+    await storage.put("a.png", bytes(60))
+    storage.read("a.png")  # Maps the first segment while it is still short.
+    await storage.put("b.png", bytes(60))
+    await storage.put("c.png", bytes(60))  # Rolls over to a second segment.
+    await storage.delete("a.png")
+    assert storage.compact() == 1
+    assert storage.names() == ["b.png", "c.png"]
+    assert bytes(storage.read("b.png")) == bytes(60)
+    storage.close()
+
+
+@pytest.mark.asyncio
+async def test_compaction_syncs_moved_records_once(tmp_path, monkeypatch):
+    storage = _open(tmp_path, segment_max_bytes=1024)
+    for number in range(5):
+        await storage.put(f"live-{number}.png", bytes(20))
+        await storage.put(f"dead-{number}.png", bytes(150))
+    for number in range(5):
+        await storage.delete(f"dead-{number}.png")
+    fsyncs = []
+    monkeypatch.setattr(segment_store, "settings", dataclasses.replace(segment_store.settings, qr_storage_fsync=True))
+    monkeypatch.setattr(segment_store.os, "fsync", fsyncs.append)
+    assert storage.compact() == 1
+    assert len(fsyncs) == 1
+    storage.close()
+
+    reopened = _open(tmp_path, segment_max_bytes=1024)
+    assert reopened.names() == [f"live-{number}.png" for number in range(5)]
+    reopened.close()
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from app.routers.qr_code import create_flights
+from app.services.qr_service import _try_claim, claim_qr_name, discard_partial_writes, release_qr_claim
+from app.services.single_flight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_single_flight_runs_work_once():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "rendered"
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(4)))
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {result for result, _ in results} == {"rendered"}
+    assert flights.stats()["coalesced"] == 3
+
+@pytest.mark.asyncio
+async def test_claim_is_exclusive(tmp_path):
+    destination = tmp_path / "code.png"
+    claim = await claim_qr_name(destination)
+    assert claim is not None
+    assert await claim_qr_name(destination) is None
+    await release_qr_claim(claim)
+    assert await claim_qr_name(destination) is not None
+
+def test_stale_claim_is_taken_over_once(tmp_path):
+    destination = tmp_path / "code.png"
+    for _ in range(20):
+        stale = tmp_path / ".code.png.lock"
+        stale.touch()
+        os.utime(stale, (time.time() - 3600, time.time() - 3600))
+        with ThreadPoolExecutor(8) as pool:
+            claims = list(pool.map(lambda _: _try_claim(destination), range(8)))
+        assert len([claim for claim in claims if claim is not None]) == 1
+        assert [path.name for path in tmp_path.iterdir()] == [".code.png.lock"]
+        stale.unlink()
+
+def test_stale_claims_are_discarded_at_start_up(tmp_path):
+    for name in (".old.png.lock", ".fresh.png.lock", ".old.png.lock.0123.stale", ".segments.lock"):
+        (tmp_path / name).touch()
+    for name in (".old.png.lock", ".segments.lock"):
+        os.utime(tmp_path / name, (time.time() - 3600, time.time() - 3600))
+    discard_partial_writes(tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".fresh.png.lock", ".segments.lock"]
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_creates_render_once(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    coalesced_before = create_flights.coalesced
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        responses = await asyncio.gather(*(
+            client.post("/qr-codes/", json={"target_url": "https://example.org/viral"}, headers=headers) for _ in range(5)
+        ))
+        created = [response for response in responses if response.status_code == 201]
+        await client.delete(f"/qr-codes/{created[0].json()['qr_link'].split('/')[-1]}", headers=headers)
+    assert sorted(response.status_code for response in responses) == [201, 409, 409, 409, 409]
+    assert all(response.json()["links"] for response in responses if response.status_code == 409)
+    assert create_flights.coalesced > coalesced_before
@@ -43,6 +43,9 @@ async def test_authenticated_qr_operations():
             "background_color": "green",
             "dimensions": 12,
         }
+        oversized_response = await client.post("/qr-codes/", json={**qr_creation_data, "dimensions": 41}, headers=authorization_header)
+        assert oversized_response.status_code == 422
+
         qr_creation_response = await client.post("/qr-codes/", json=qr_creation_data, headers=authorization_header)
         assert qr_creation_response.status_code in [201, 409]
 
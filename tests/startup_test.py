@@ -0,0 +1,49 @@
+import dataclasses
+import subprocess
+import sys
+
+import pytest
+
+from app.config import Settings, load_settings, settings
+
+
+def test_importing_the_app_defers_heavy_libraries():
+    # A fresh interpreter, since the test session itself has already imported them.
+    probe = "import sys, app.main; print(sorted(m for m in ('qrcode', 'numpy', 'jose', 'validators') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_settings_are_frozen():
+    assert isinstance(settings, Settings)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.render_workers = 99
+    with pytest.raises(TypeError):
+        settings.log_rate_limits["root"] = 1.0
+
+
+def test_render_workers_default_is_shared_between_web_workers(monkeypatch):
+    monkeypatch.delenv("RENDER_WORKERS", raising=False)
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert load_settings().render_workers == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "16")
+    assert load_settings().render_workers == 1
+
+
+def test_segment_storage_is_refused_for_several_web_workers(monkeypatch):
+    monkeypatch.setenv("QR_STORAGE_BACKEND", "segments")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(ValueError, match="WEB_CONCURRENCY"):
+        load_settings()
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert load_settings().qr_storage_backend == "segments"
+
+
+def test_colors_are_validated_at_start_up(monkeypatch):
+    monkeypatch.setenv("QR_CODE_COLOR", "darkviolet")
+    monkeypatch.setenv("QR_BACKGROUND_HUE", "#fafafa")
+    assert load_settings().qr_code_color == "darkviolet"
+    monkeypatch.setenv("QR_BACKGROUND_HUE", "not-a-color")
+    with pytest.raises(ValueError, match="QR_BACKGROUND_HUE"):
+        load_settings()
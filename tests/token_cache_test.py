@@ -0,0 +1,37 @@
+import pytest
+from httpx import AsyncClient
+from app.config import settings
+from app.main import app
+from app.utils.token_cache import VerifiedTokenCache, verified_tokens
+
+def test_token_cache_evicts_at_expiry_and_when_full():
+    cache = VerifiedTokenCache(max_entries=2)
+    cache.put("a", {"sub": "admin", "exp": 100}, now=0)
+    cache.put("b", {"sub": "admin", "exp": 200}, now=0)
+    assert cache.get("a", now=50) == {"sub": "admin", "exp": 100}
+    assert cache.get("a", now=100) is None
+    cache.put("c", {"sub": "admin", "exp": 300}, now=150)
+    cache.put("d", {"sub": "admin", "exp": 300}, now=150)
+    assert cache.get("b", now=150) is None
+    assert cache.stats()["entries"] == 2
+    cache.put("no-exp", {"sub": "admin"}, now=150)
+    assert cache.get("no-exp", now=150) is None
+
+@pytest.mark.asyncio
+async def test_bearer_tokens_are_verified_and_cached(get_access_token_for_test):
+    headers = {"Authorization": f"Bearer {get_access_token_for_test}"}
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        await client.get("/qr-codes/", headers=headers)
+        hits_before = verified_tokens.hits
+        assert (await client.get("/qr-codes/", headers=headers)).status_code == 200
+        forged = await client.get("/qr-codes/", headers={"Authorization": f"Bearer {get_access_token_for_test}x"})
+    assert verified_tokens.hits == hits_before + 1
+    assert forged.status_code == 401
+
+@pytest.mark.asyncio
+async def test_tokens_without_expiry_are_rejected():
+    from jose import jwt
+    token = jwt.encode({"sub": "admin"}, settings.secret_key, algorithm=settings.algorithm)
+    async with AsyncClient(app=app, base_url="http://testserver") as client:
+        response = await client.get("/qr-codes/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401